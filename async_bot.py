@@ -0,0 +1,233 @@
+"""Запуск бота в одном цикле asyncio на AsyncTeleBot.
+
+Обновления принимает AsyncTeleBot, обработчики из bot.py остаются
+теми же. Они синхронные и работают с базой, поэтому выполняются в
+DB_EXECUTOR — отдельном пуле потоков, через который идут все вызовы
+database.py из цикла. Запросов к Bot API в этих потоках нет: вместо
+TeleBot обработчики получают BufferedBot, который записывает ответы,
+а цикл отправляет их корутинами AsyncTeleBot после обработчика.
+Очерёдность шагов диалога держит asyncio.Lock на пользователя:
+ожидающий разговор стоит одну корутину, а не поток, так что тысячи
+диалогов обслуживает один процесс с DB_WORKERS соединениями sqlite.
+
+Планировщик напоминаний и перенос в архив — задачи того же цикла,
+их запросы к базе тоже идут через DB_EXECUTOR. Отправка из outbox
+остаётся в своём потоке (OutboxSender) с общим ограничением скорости.
+
+Нужен aiohttp (зависимость AsyncTeleBot). Запуск: python async_bot.py
+"""
+import asyncio
+import contextlib
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retention import RETENTION_INTERVAL, run_retention
+from utils import NEW_ROWS_POLL, ReminderScheduler, backfill
+
+# sqlite-соединения открываются по одному на поток, пул ограничивает их число
+DB_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DB_WORKERS', 4)),
+    thread_name_prefix='db',
+)
+
+
+async def run_db(function, *args, **kwargs):
+    """Выполнить синхронную функцию в DB_EXECUTOR, не блокируя цикл"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        DB_EXECUTOR, functools.partial(function, *args, **kwargs)
+    )
+
+
+class UserLocks:
+    """asyncio.Lock на пользователя; удаляется, когда его никто не ждёт"""
+
+    def __init__(self):
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id):
+        entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class Replies:
+    """Вызовы Bot API одного обработчика в порядке записи"""
+
+    def __init__(self):
+        self.calls = []
+        self.callbacks = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return record
+
+    def after_replies(self, callback):
+        """callback() после отправки, например закрытие файла выгрузки"""
+        self.callbacks.append(callback)
+
+    async def send(self, async_bot):
+        try:
+            for name, args, kwargs in self.calls:
+                try:
+                    await getattr(async_bot, name)(*args, **kwargs)
+                except Exception as e:
+                    print(f"Ошибка отправки ответа: {e}")
+        finally:
+            for callback in self.callbacks:
+                callback()
+
+
+class BufferedBot:
+    """Замена TeleBot для обработчиков bot.py.
+
+    В потоке обработчика (collect) вызовы записываются в Replies.
+    В остальных потоках, например в фоновом импорте, вызов выполняется
+    корутиной AsyncTeleBot в цикле, а поток ждёт результат.
+    """
+
+    def __init__(self, async_bot, loop):
+        self.async_bot = async_bot
+        self.loop = loop
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        replies = getattr(self.local, 'replies', None)
+        if replies is not None:
+            return getattr(replies, name)
+        method = getattr(self.async_bot, name)
+
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(
+                method(*args, **kwargs), self.loop
+            ).result()
+        return call
+
+    def collect(self, function, update):
+        """Выполнить обработчик, вернуть записанные им ответы"""
+        self.local.replies = replies = Replies()
+        try:
+            function(update)
+        except Exception as e:
+            print(f"Ошибка обработки обновления: {e}")
+        finally:
+            self.local.replies = None
+        return replies
+
+
+def install(router, async_bot, buffered, locks=None,
+            content_types=('text', 'document')):
+    """Подключение обработчиков router к AsyncTeleBot.
+
+    buffered — BufferedBot, через который отвечают обработчики router.
+    """
+    locks = locks or UserLocks()
+
+    async def handle(dispatch, update):
+        async with locks.hold(update.from_user.id):
+            replies = await run_db(buffered.collect, dispatch, update)
+            await replies.send(async_bot)
+
+    async def on_message(message):
+        await handle(router.dispatch_message, message)
+
+    async def on_callback(call):
+        await handle(router.dispatch_callback, call)
+
+    async_bot.register_message_handler(
+        on_message, content_types=list(content_types)
+    )
+    async_bot.register_callback_query_handler(
+        on_callback, func=lambda call: True
+    )
+    return locks
+
+
+class AsyncReminderScheduler(ReminderScheduler):
+    """ReminderScheduler, которым управляет задача asyncio вместо потока.
+
+    Ожидание ближайшего срока — asyncio.Event; его будят изменения
+    напоминаний, приходящие из потоков DB_EXECUTOR.
+    """
+
+    def __init__(self, bot_instance, loop, **kwargs):
+        super().__init__(bot_instance, **kwargs)
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+
+    def wake(self):
+        super().wake()
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run_async(self):
+        while not self.stopped.is_set():
+            try:
+                await run_db(self.prepare)
+            except Exception as e:
+                print(f"Ошибка в ReminderScheduler: {e}")
+                await asyncio.sleep(NEW_ROWS_POLL)
+                continue
+            self.wakeup.clear()
+            delay = self.wake_at() - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            due = self.take_due(time.time())
+            if due:
+                await run_db(self.fire, due)
+
+
+async def retention_task(interval=RETENTION_INTERVAL):
+    while True:
+        try:
+            await run_db(run_retention)
+        except Exception as e:
+            print(f"Ошибка переноса в архив: {e}")
+        await asyncio.sleep(interval)
+
+
+async def main():
+    from telebot.async_telebot import AsyncTeleBot  # type: ignore
+
+    import bot as handlers
+    import metrics
+
+    if os.getenv("METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("METRICS_PORT")))
+    loop = asyncio.get_running_loop()
+    async_bot = AsyncTeleBot(os.getenv("TELEGRAM_TOKEN"))
+    # Синхронный клиент bot.py остаётся только у OutboxSender: его потоки
+    # не входят в DB_EXECUTOR, а MessageDispatcher разбирает ответы 429
+    # по исключениям telebot.apihelper
+    scheduler = AsyncReminderScheduler(handlers.bot, loop)
+    handlers.bot = BufferedBot(async_bot, loop)
+    install(handlers.router, async_bot, handlers.bot)
+
+    threading.Thread(target=scheduler.sender.run, daemon=True).start()
+    threading.Thread(target=backfill, args=(scheduler,), daemon=True).start()
+    await async_bot.delete_webhook()
+    await asyncio.gather(
+        scheduler.run_async(),
+        retention_task(),
+        async_bot.infinity_polling(),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
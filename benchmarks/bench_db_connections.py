@@ -0,0 +1,82 @@
+"""Операций в секунду: соединение на каждую операцию против пула потока.
+
+«До» — прежний DB: новое sqlite3.connect на каждый вызов в режиме
+rollback journal. «После» — database.DB с постоянным соединением потока,
+WAL и настройками из CONNECTION_PRAGMAS.
+
+Запуск: python benchmarks/bench_db_connections.py [кол-во операций]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+DEFAULT_OPERATIONS = 5000
+USERS = 100
+
+
+class ConnectPerCall:
+    """Контекстный менеджер в том виде, в каком он был до пула"""
+
+    def __enter__(self):
+        self.conn = sqlite3.connect(database.DB_PATH)
+        return self.conn.cursor()
+
+    def __exit__(self, type, value, traceback):
+        self.conn.commit()
+        self.conn.close()
+
+
+def workload(db_class, operations):
+    """Смесь чтений и записей, как у обработчиков списка покупок"""
+    start = time.perf_counter()
+    for i in range(operations):
+        user_id = i % USERS
+        with db_class() as cursor:
+            if i % 4 == 0:
+                cursor.execute(
+                    'INSERT INTO shopping_list (user_id, item, category, created) '
+                    'VALUES (?, ?, ?, ?)',
+                    (user_id, f'item{i}', 'bench', datetime.now())
+                )
+            else:
+                cursor.execute(
+                    'SELECT id, item, category FROM shopping_list WHERE user_id = ?',
+                    (user_id,)
+                )
+                cursor.fetchall()
+    return operations / (time.perf_counter() - start)
+
+
+def run(db_class, operations, wal):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        database.close_connections()
+        if not wal:
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute('PRAGMA journal_mode = DELETE')
+            conn.close()
+        try:
+            return workload(db_class, operations)
+        finally:
+            database.close_connections()
+
+
+def main(operations):
+    before = run(ConnectPerCall, operations, wal=False)
+    after = run(database.DB, operations, wal=True)
+    print(f'{"":>24} {"ops/s":>10}')
+    print(f'{"connect per call":>24} {before:>10.0f}')
+    print(f'{"pooled + WAL":>24} {after:>10.0f}')
+    print(f'{"speedup":>24} {after / before:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_OPERATIONS)
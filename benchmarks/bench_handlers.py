@@ -0,0 +1,110 @@
+"""Обновлений в секунду через обработчики bot.py на разных хранилищах.
+
+Сценарий повторяет действия пользователя: /start, добавление товара
+в три шага, просмотр и очистка списка, создание и просмотр напоминания.
+Сетевые вызовы Telegram заменены пустыми функциями, обработчики
+выполняются синхронно в текущем потоке.
+
+Запуск: python benchmarks/bench_handlers.py [кол-во пользователей]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TELEGRAM_TOKEN', '1234:bench')
+os.environ['STORAGE_BACKEND'] = 'memory'
+
+from telebot import types  # type: ignore  # noqa: E402
+
+DEFAULT_USERS = 500
+TELEGRAM_CALLS = (
+    'send_message', 'send_document', 'answer_callback_query', 'delete_message'
+)
+
+
+def message(update_id, user_id, text):
+    return types.Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+            'text': text,
+            **({'entities': [
+                {'type': 'bot_command', 'offset': 0, 'length': len(text)}
+            ]} if text.startswith('/') else {}),
+        },
+    })
+
+
+def callback(update_id, user_id, data):
+    return types.Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'bench'},
+            'chat_instance': 'bench',
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': '',
+            },
+        },
+    })
+
+
+def scenario(users):
+    updates, update_id = [], 0
+    for user_id in range(1, users + 1):
+        steps = [
+            (message, '/start'),
+            (callback, 'add_item'),
+            (message, 'молоко'),
+            (message, 'продукты'),
+            (callback, 'show_list'),
+            (callback, 'create_reminder'),
+            (message, 'позвонить'),
+            (message, '23:59 31.12.2099'),
+            (message, 'Ежедневно'),
+            (callback, 'list_reminders'),
+            (callback, 'delete_all_items'),
+        ]
+        for make, text in steps:
+            update_id += 1
+            updates.append(make(update_id, user_id, text))
+    return updates
+
+
+def run(bot_module, storage, updates):
+    bot_module.storage = storage
+    start = time.perf_counter()
+    # По одному: пачку telebot разбирает по типам, а не по порядку
+    for update in updates:
+        bot_module.bot.process_new_updates([update])
+    return len(updates) / (time.perf_counter() - start)
+
+
+def main(users):
+    import bot
+    from storage import MemoryStorage, SQLiteStorage
+
+    bot.bot.threaded = False
+    for name in TELEGRAM_CALLS:
+        setattr(bot.bot, name, lambda *args, **kwargs: None)
+
+    updates = scenario(users)
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite = run(bot, SQLiteStorage(os.path.join(tmp, 'bench.db')), updates)
+    memory = run(bot, MemoryStorage(), updates)
+    print(f'{"":>10} {"updates/s":>10}')
+    print(f'{"sqlite":>10} {sqlite:>10.0f}')
+    print(f'{"memory":>10} {memory:>10.0f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_USERS)
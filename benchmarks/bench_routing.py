@@ -0,0 +1,81 @@
+"""Обновлений в секунду: цепочка фильтров telebot против routing.Router.
+
+Регистрируется N обработчиков шагов диалога; пользователь находится
+на последнем шаге — худший случай для цепочки, где фильтры
+проверяются по порядку и каждый заново читает состояние. Оба варианта
+идут через TeleBot.process_new_updates без сети.
+
+Запуск: python benchmarks/bench_routing.py [кол-во обновлений]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot  # type: ignore  # noqa: E402
+from telebot import types  # type: ignore  # noqa: E402
+
+from routing import Router  # noqa: E402
+from states import MemoryStateStore  # noqa: E402
+
+DEFAULT_UPDATES = 5000
+HANDLER_COUNTS = (10, 50, 200)
+USER_ID = 1
+
+
+def update():
+    return types.Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'date': 0,
+            'chat': {'id': USER_ID, 'type': 'private'},
+            'from': {'id': USER_ID, 'is_bot': False, 'first_name': 'bench'},
+            'text': 'ответ',
+        },
+    })
+
+
+def filter_chain_bot(states, handlers):
+    bot = telebot.TeleBot('1234:bench', threaded=False)
+    for i in range(handlers):
+        bot.register_message_handler(
+            lambda message: None,
+            func=lambda m, step=f'step{i}': states.step(m.from_user.id) == step,
+        )
+    return bot
+
+
+def router_bot(states, handlers):
+    bot = telebot.TeleBot('1234:bench', threaded=False)
+    router = Router(states)
+    for i in range(handlers):
+        router.step(f'step{i}')(lambda message: None)
+    router.install(bot)
+    return bot
+
+
+def run(bot, updates):
+    batch = [update()]
+    start = time.perf_counter()
+    for _ in range(updates):
+        bot.process_new_updates(batch)
+    return updates / (time.perf_counter() - start)
+
+
+def main(updates):
+    print(f'{"handlers":>10} {"filters/s":>10} {"router/s":>10} {"speedup":>8}')
+    for handlers in HANDLER_COUNTS:
+        states = MemoryStateStore()
+        states.set(USER_ID, {'step': f'step{handlers - 1}'})
+        before = run(filter_chain_bot(states, handlers), updates)
+        after = run(router_bot(states, handlers), updates)
+        print(
+            f'{handlers:>10} {before:>10.0f} {after:>10.0f} '
+            f'{after / before:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_UPDATES)
@@ -0,0 +1,66 @@
+"""Сравнение построчной и пакетной записи изменений тика планировщика.
+
+Запуск: python benchmarks/bench_tick_writes.py [кол-во ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from outbox import enqueue  # noqa: E402
+from utils import apply_tick  # noqa: E402
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+
+def prepare(count):
+    """Свежая база с count наступившими напоминаниями, каждое второе — ежедневное"""
+    with database.DB() as cursor:
+        cursor.execute('DELETE FROM reminders')
+        cursor.execute('DELETE FROM outbox')
+        cursor.executemany(
+            'INSERT INTO reminders (id, user_id, text, due_at, repeat) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(i, i, f'r{i}', 1577869200, 'daily' if i % 2 else None)
+             for i in range(1, count + 1)]
+        )
+    messages = [(f'reminder:{i}:bench', i, 1577869200, i, f'r{i}')
+                for i in range(1, count + 1)]
+    moved = [(1577955600, i) for i in range(1, count + 1, 2)]
+    finished = [(i,) for i in range(2, count + 1, 2)]
+    return messages, moved, finished
+
+
+def row_at_a_time(cursor, messages, moved, finished):
+    for message in messages:
+        enqueue(cursor, *message)
+    for row in moved:
+        cursor.execute('UPDATE reminders SET due_at = ? WHERE id = ?', row)
+    for row in finished:
+        cursor.execute('UPDATE reminders SET is_active = 0 WHERE id = ?', row)
+
+
+def measure(write, count):
+    changes = prepare(count)
+    start = time.perf_counter()
+    with database.DB() as cursor:
+        write(cursor, *changes)
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        print(f"{'due':>8} {'row-at-a-time, s':>18} {'batched, s':>12} {'speedup':>8}")
+        for count in sizes:
+            single = measure(row_at_a_time, count)
+            batched = measure(apply_tick, count)
+            print(f'{count:>8} {single:>18.3f} {batched:>12.3f} {single / batched:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -1,30 +1,62 @@
+import html
 import os
 import threading
 import telebot  # type: ignore
 from telebot import types  # type: ignore
 
-from database import (
-    init_db,
-    DB,
-    add_reminder,
-    get_reminders,
-    delete_reminder,
-    get_shopping_list,
-    add_shopping_item,
-    delete_shopping_item,
-)
+from storage import create_storage
+from states import create_state_store
+from routing import Router
+import export
+import importer
+from shopping import parse_items
+from paging import Page, clip, fit_page, load_page
 
 from dotenv import load_dotenv  # type: ignore
 from datetime import datetime, timedelta
 from utils import schedule_checker
+import metrics
+import webhook
+from lanes import LaneExecutor, poll
 
 
 load_dotenv()
-bot = telebot.TeleBot(os.getenv("TELEGRAM_TOKEN"))
-init_db()
+# Если задан, обновления принимаются webhook, иначе long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Обработчики выполняются в полосах LaneExecutor: по порядку для
+# каждого пользователя, параллельно для разных. Полосы создаются при
+# запуске, а не при импорте: async_bot.py берёт отсюда только обработчики
+bot = telebot.TeleBot(os.getenv("TELEGRAM_TOKEN"), threaded=False)
+storage = create_storage()
+states = create_state_store()
+router = Router(states)
+router.install(bot)
+
+
+def create_application(lanes=None):
+    return webhook.WebhookApp(
+        bot,
+        WEBHOOK_SECRET,
+        path=webhook.webhook_path(WEBHOOK_URL),
+        lanes=lanes,
+        lock=webhook.ProcessLock(os.getenv("WEBHOOK_LOCK", "webhook.lock")),
+    )
+
 
+def __getattr__(name):
+    """bot.application для WSGI-сервера создаётся при первом обращении"""
+    global application
+    if name == "application":
+        application = create_application()
+        return application
+    raise AttributeError(name)
 
-USER_STATES = {}
+# Telegram id администраторов через запятую, для служебных команд
+ADMIN_IDS = {
+    int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",")
+    if admin_id.strip()
+}
 
 
 def get_main_markup():
@@ -34,14 +66,10 @@ def get_main_markup():
     return markup
 
 
-@bot.message_handler(commands=["start"])
+@router.command("start")
 def start(message):
     user_id = message.from_user.id
-    with DB() as cursor:
-        cursor.execute(
-            "INSERT OR IGNORE INTO users (user_id, created) VALUES (?, ?)",
-            (user_id, datetime.now()),
-        )
+    storage.add_user(user_id)
     bot.send_message(
         message.chat.id,
         "Привет! Я твой ежедневный помощник. Выбери действие:",
@@ -49,7 +77,7 @@ def start(message):
     )
 
 
-@bot.message_handler(func=lambda m: m.text == "📝 Напоминания")
+@router.text("📝 Напоминания")
 def handle_reminders(message):
     markup = types.InlineKeyboardMarkup()
     markup.add(
@@ -60,27 +88,23 @@ def handle_reminders(message):
     bot.send_message(message.chat.id, "Управление напоминаниями:", reply_markup=markup)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "create_reminder")
+@router.callback("create_reminder")
 def create_reminder(call):
-    USER_STATES[call.from_user.id] = {"step": "reminder_text"}
+    states.set(call.from_user.id, {"step": "reminder_text"})
     bot.send_message(call.message.chat.id, "Введите текст напоминания:")
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "reminder_text"
-)
+@router.step("reminder_text")
 def process_reminder_text(message):
     user_id = message.from_user.id
-    USER_STATES[user_id] = {"step": "reminder_date", "text": message.text}
+    states.set(user_id, {"step": "reminder_date", "text": message.text})
     bot.send_message(
         message.chat.id,
         "Введите дату и время в формате ЧЧ:ММ ДД.ММ.ГГГГ (например, 14:30 31.12.2023):",
     )
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "reminder_date"
-)
+@router.step("reminder_date")
 def process_reminder_date(message):
     """Обработка даты с поддержкой 'сегодня' и 'завтра'"""
     user_id = message.from_user.id
@@ -122,11 +146,14 @@ def process_reminder_date(message):
             )
             return
 
-        USER_STATES[user_id] = {
-            "step": "reminder_repeat",
-            "text": USER_STATES[user_id]["text"],
-            "date": dt,
-        }
+        states.set(
+            user_id,
+            {
+                "step": "reminder_repeat",
+                "text": states.get(user_id)["text"],
+                "date": dt,
+            },
+        )
 
         # Клавиатура для выбора периодичности
         markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -142,9 +169,7 @@ def process_reminder_date(message):
         print(f"Date processing error: {e}")
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "reminder_repeat"
-)
+@router.step("reminder_repeat")
 def process_reminder_repeat(message):
     user_id = message.from_user.id
     repeat_map = {
@@ -156,61 +181,57 @@ def process_reminder_repeat(message):
     }
     repeat = repeat_map.get(message.text)
 
-    dt = USER_STATES[user_id]["date"]
+    state = states.get(user_id)
+    dt = state["date"]
 
-    add_reminder(user_id, USER_STATES[user_id]["text"], dt, repeat=repeat)
+    storage.add_reminder(user_id, state["text"], dt, repeat=repeat)
     local_time = dt.strftime("%H:%M %d.%m.%Y")
     bot.send_message(
         message.chat.id,
         f"✅ Напоминание создано на {local_time}",
         reply_markup=get_main_markup(),
     )
-    del USER_STATES[user_id]
+    states.delete(user_id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "list_reminders")
+@router.callback("list_reminders")
 def list_reminders(call):
-    reminders = get_reminders(call.from_user.id)
-    if not reminders:
-        bot.send_message(call.message.chat.id, "У вас нет активных напоминаний.")
-        return
+    send_page(call, "reminders")
+
 
+def render_reminders(page):
     text = "Ваши напоминания:\n\n"
-    for rem in reminders:
-        text += f"{rem[0]}. {rem[1]} - {rem[2].strftime('%H:%M %d.%m.%Y')}"
+    for rem in page.rows:
+        text += f"{rem[0]}. {clip(rem[1])} - {rem[2].strftime('%H:%M %d.%m.%Y')}"
         if rem[3]:
             text += f" (повтор: {rem[3]})"
         text += "\n"
+    return text, types.InlineKeyboardMarkup()
 
-    bot.send_message(call.message.chat.id, text)
 
-
-@bot.callback_query_handler(func=lambda call: call.data == "delete_reminder")
+@router.callback("delete_reminder")
 def delete_reminder_callback(call):
-    USER_STATES[call.from_user.id] = {"step": "delete_reminder"}
+    states.set(call.from_user.id, {"step": "delete_reminder"})
     bot.send_message(call.message.chat.id, "Введите ID напоминания для удаления:")
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "delete_reminder"
-)
+@router.step("delete_reminder")
 def process_delete_reminder(message):
     user_id = message.from_user.id
     try:
         rem_id = int(message.text)
-        delete_reminder(rem_id)
+        storage.delete_reminder(rem_id)
         bot.send_message(
             message.chat.id, "Напоминание удалено!", reply_markup=get_main_markup()
         )
     except ValueError:
         bot.send_message(message.chat.id, "Неверный ID. Введите число.")
     finally:
-        if user_id in USER_STATES:
-            del USER_STATES[user_id]
+        states.delete(user_id)
 
 
 # В функции handle_shopping_list добавляем новую кнопку
-@bot.message_handler(func=lambda m: m.text == "🛒 Список покупок")
+@router.text("🛒 Список покупок")
 def handle_shopping_list(message):
     markup = types.InlineKeyboardMarkup()
     markup.add(
@@ -226,104 +247,183 @@ def handle_shopping_list(message):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_item")
+@router.callback("add_item")
 def add_shopping_item_callback(call):
-    USER_STATES[call.from_user.id] = {"action": "add_item", "step": "item"}
-    bot.send_message(call.message.chat.id, "Введите название товара:")
+    states.set(call.from_user.id, {"action": "add_item", "step": "item"})
+    bot.send_message(
+        call.message.chat.id,
+        "Введите название товара или несколько — через запятую или с новой строки. "
+        "Категорию можно указать в начале строки: «Молочное: молоко, кефир».",
+    )
 
 
 # Добавляем кнопку для полной очистки списка покупок
-@bot.callback_query_handler(func=lambda call: call.data == "delete_all_items")
+@router.callback("delete_all_items")
 def delete_all_shopping_items(call):
-    with DB() as cursor:
-        cursor.execute(
-            "DELETE FROM shopping_list WHERE user_id = ?", (call.from_user.id,)
-        )
+    storage.delete_all_shopping_items(call.from_user.id)
     bot.answer_callback_query(call.id, "Весь список удален!")
     bot.send_message(
         call.message.chat.id, "Список покупок очищен.", reply_markup=get_main_markup()
     )
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "item"
-)
+@router.step("item")
 def process_shopping_item(message):
     user_id = message.from_user.id
-    USER_STATES[user_id] = {
-        "action": "add_item",
-        "step": "category",
-        "item": message.text,
-    }
+    items = parse_items(message.text or "")
+    if not items:
+        bot.send_message(message.chat.id, "Введите название товара:")
+        return
+    if all(category for _, category in items):
+        save_shopping_items(message, items)
+        return
+    states.set(user_id, {"action": "add_item", "step": "category", "items": items})
     bot.send_message(
         message.chat.id, "Введите категорию товара (если не требуется, отправьте '-'):"
     )
 
 
-@bot.message_handler(
-    func=lambda m: USER_STATES.get(m.from_user.id, {}).get("step") == "category"
-)
+@router.step("category")
 def process_shopping_category(message):
-    user_id = message.from_user.id
     category = message.text.strip()
     if category == "-":
         category = "Без категории"
-    add_shopping_item(user_id, USER_STATES[user_id]["item"], category)
+    save_shopping_items(message, states.get(message.from_user.id)["items"], category)
+
+
+def save_shopping_items(message, items, default_category=None):
+    """Запись всех товаров сообщения одной транзакцией"""
+    user_id = message.from_user.id
+    storage.add_shopping_items(
+        user_id, [(item, category or default_category, 1) for item, category in items]
+    )
     bot.send_message(
         message.chat.id,
-        "Товар добавлен в список покупок!",
+        "Товар добавлен в список покупок!"
+        if len(items) == 1
+        else f"Добавлено товаров: {len(items)}",
         reply_markup=get_main_markup(),
     )
-    del USER_STATES[user_id]
+    states.delete(user_id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "show_list")
+@router.callback("show_list")
 def show_shopping_list(call):
-    items = get_shopping_list(call.from_user.id)
-    if not items:
-        bot.send_message(call.message.chat.id, "Ваш список покупок пуст.")
-        return
+    send_page(call, "shopping")
 
+
+def render_shopping_list(page):
     items_by_category = {}
-    for item in items:
+    for item in page.rows:
         category = item[2] if item[2] else "Без категории"
         if category not in items_by_category:
             items_by_category[category] = []
-        items_by_category[category].append(item[1])
+        name = html.escape(clip(item[1]))
+        items_by_category[category].append(
+            f"{name} ×{item[3]}" if item[3] > 1 else name
+        )
 
     text = "Ваш список покупок:\n\n"
     for category in items_by_category:
-        text += f"<b>{category}:</b>\n"
+        text += f"<b>{html.escape(clip(category))}:</b>\n"
         text += "\n".join(f"• {item}" for item in items_by_category[category])
         text += "\n\n"
-
-    bot.send_message(call.message.chat.id, text, parse_mode="HTML")
+    return text, types.InlineKeyboardMarkup()
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "delete_item")
+@router.callback("delete_item")
 def delete_shopping_item_callback(call):
-    items = get_shopping_list(call.from_user.id)
-    if not items:
-        bot.send_message(call.message.chat.id, "Ваш список покупок пуст.")
-        return
+    send_page(call, "delete_item")
+
 
+def render_delete_items(page):
     markup = types.InlineKeyboardMarkup()
-    for item in items:
+    for item in page.rows:
         markup.add(
             types.InlineKeyboardButton(
-                f"{item[1]} ({item[2]})", callback_data=f"delete_item_{item[0]}"
+                clip(f"{item[1]} ({item[2]})", 60), callback_data=f"delete_item_{item[0]}"
             )
         )
-
-    bot.send_message(
-        call.message.chat.id, "Выберите товар для удаления:", reply_markup=markup
+    return "Выберите товар для удаления:", markup
+
+
+# Постраничные списки: имя -> (метод хранилища, отрисовка страницы,
+# текст для пустого списка, parse_mode). Кнопки листания несут
+# callback_data вида "page:<имя>:<n|p>:<id>"
+PAGE_VIEWS = {
+    "reminders": (
+        "page_reminders",
+        render_reminders,
+        "У вас нет активных напоминаний.",
+        None,
+    ),
+    "shopping": (
+        "page_shopping_list",
+        render_shopping_list,
+        "Ваш список покупок пуст.",
+        "HTML",
+    ),
+    "delete_item": (
+        "page_shopping_list",
+        render_delete_items,
+        "Ваш список покупок пуст.",
+        None,
+    ),
+}
+
+
+def send_page(call, view, after=None, before=None):
+    """Страница списка: первая — новым сообщением, остальные — правкой текущего"""
+    method, render, empty_text, parse_mode = PAGE_VIEWS[view]
+    page = load_page(
+        getattr(storage, method), call.from_user.id, after=after, before=before
     )
+    if not page.rows:
+        bot.send_message(call.message.chat.id, empty_text)
+        return
 
+    page, text, markup = fit_page(page, render, backward=before is not None)
+    buttons = []
+    if page.has_prev:
+        buttons.append(types.InlineKeyboardButton(
+            "◀️ Назад", callback_data=f"page:{view}:p:{page.rows[0][0]}"
+        ))
+    if page.has_next:
+        buttons.append(types.InlineKeyboardButton(
+            "Вперёд ▶️", callback_data=f"page:{view}:n:{page.rows[-1][0]}"
+        ))
+    if buttons:
+        markup.row(*buttons)
+    markup = markup if markup.keyboard else None
+
+    if after is None and before is None:
+        bot.send_message(
+            call.message.chat.id, text, reply_markup=markup, parse_mode=parse_mode
+        )
+    else:
+        bot.edit_message_text(
+            text,
+            call.message.chat.id,
+            call.message.message_id,
+            reply_markup=markup,
+            parse_mode=parse_mode,
+        )
+
+
+@router.callback_prefix("page:")
+def turn_page(call):
+    _, view, direction, row_id = call.data.split(":")
+    bot.answer_callback_query(call.id)
+    if direction == "n":
+        send_page(call, view, after=int(row_id))
+    else:
+        send_page(call, view, before=int(row_id))
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_item_"))
+
+@router.callback_prefix("delete_item_")
 def process_delete_item(call):
     item_id = call.data.split("_")[-1]
-    delete_shopping_item(item_id)
+    storage.delete_shopping_item(item_id)
     bot.answer_callback_query(call.id, "Товар удален!")
     bot.delete_message(call.message.chat.id, call.message.message_id)
     bot.send_message(
@@ -331,35 +431,155 @@ def process_delete_item(call):
     )
 
 
-@bot.message_handler(func=lambda m: m.text == "💡 Предложить функционал")
+@router.text("💡 Предложить функционал")
 def suggest_feature(message):
     bot.send_message(
         message.chat.id, "Ваши предложения по улучшению бота отправляйте разработчику."
     )
 
 
-@bot.message_handler(commands=["export"])
+@router.command("export")
 def export_data(message):
+    """Выгрузка напоминаний и списка покупок: /export [csv|jsonl]"""
     user_id = message.from_user.id
-    reminders = get_reminders(user_id)
+    args = message.text.split()[1:]
+    fmt = args[0].lower() if args else "csv"
+    if fmt not in export.FORMATS:
+        bot.send_message(message.chat.id, "Формат выгрузки: /export csv или /export jsonl")
+        return
+
+    send_export(
+        message.chat.id,
+        export.export_reminders(storage.iter_reminders(user_id), fmt),
+        "У вас нет напоминаний для экспорта.",
+    )
+    send_export(
+        message.chat.id,
+        export.export_shopping_list(storage.iter_shopping_list(user_id), fmt),
+        "Ваш список покупок пуст.",
+    )
+    send_export(
+        message.chat.id,
+        export.export_reminders(
+            storage.iter_archived_reminders(user_id), fmt, name="reminders_archive"
+        ),
+    )
+
+
+def send_export(chat_id, result, empty_text=None):
+    try:
+        if result.rows:
+            bot.send_document(chat_id, result.file, visible_file_name=result.filename)
+        elif empty_text:
+            bot.send_message(chat_id, empty_text)
+    finally:
+        after_replies(result.close)
+
+
+def after_replies(callback):
+    """callback() после отправки ответов обработчика.
+
+    TeleBot отправляет сразу, а в async_bot.py ответы уходят уже после
+    обработчика, поэтому открытый файл закрывается там (Replies.send).
+    """
+    getattr(bot, "after_replies", lambda callback: callback())(callback)
+
+
+@router.command("find")
+def find(message):
+    """Поиск по напоминаниям и списку покупок: /find <слова>"""
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        bot.send_message(message.chat.id, "Укажите, что искать: /find молоко")
+        return
+    reminders, items = storage.search(message.from_user.id, query)
+    if not reminders and not items:
+        bot.send_message(message.chat.id, "Ничего не найдено.")
+        return
+
+    # Строки ранжированы, при обрезке до лимита сообщения
+    # отбрасываются наименее подходящие товары, затем напоминания
+    page = Page(
+        [("reminder", rem) for rem in reminders] + [("item", item) for item in items],
+        False,
+        False,
+    )
+    _, text, _ = fit_page(page, render_search)
+    bot.send_message(message.chat.id, text)
+
+
+def render_search(page):
+    reminders = [row for kind, row in page.rows if kind == "reminder"]
+    items = [row for kind, row in page.rows if kind == "item"]
+    text = ""
     if reminders:
-        reminders_csv = "ID,Текст,Дата,Повтор\n"
+        text += "Напоминания:\n"
         for rem in reminders:
-            reminders_csv += f"{rem[0]},{rem[1]},{rem[2].strftime('%d.%m.%Y %H:%M')},{rem[3] or 'нет'}\n"
-        bot.send_document(message.chat.id, ("reminders.csv", reminders_csv))
-    else:
-        bot.send_message(message.chat.id, "У вас нет напоминаний для экспорта.")
-
-    items = get_shopping_list(user_id)
+            text += f"{rem[0]}. {clip(rem[1])} - {rem[2].strftime('%H:%M %d.%m.%Y')}\n"
+        text += "\n"
     if items:
-        items_csv = "ID,Товар,Категория\n"
-        for item in items:
-            items_csv += f"{item[0]},{item[1]},{item[2]}\n"
-        bot.send_document(message.chat.id, ("shopping_list.csv", items_csv))
-    else:
-        bot.send_message(message.chat.id, "Ваш список покупок пуст.")
+        text += "Список покупок:\n"
+        text += "\n".join(f"• {clip(item[1])} ({clip(item[2] or '')})" for item in items)
+        text += "\n"
+    if page.has_next:
+        text += "\nПоказаны не все результаты, уточните запрос."
+    return text, None
+
+
+@router.command("import")
+def import_command(message):
+    states.set(message.from_user.id, {"step": "import"})
+    bot.send_message(
+        message.chat.id,
+        "Отправьте файл, полученный командой /export (CSV или JSONL, можно .gz).",
+    )
+
+
+@router.step("import", content_types=["document"])
+def process_import(message):
+    user_id = message.from_user.id
+    states.delete(user_id)
+    document = message.document
+    if document.file_size and document.file_size > importer.MAX_FILE_SIZE:
+        bot.send_message(message.chat.id, "Файл слишком большой, максимум 20 МБ.")
+        return
+    bot.send_message(message.chat.id, "Импорт начат, пришлю отчёт по завершении.")
+    importer.EXECUTOR.submit(run_import, message.chat.id, user_id, document)
+
+
+def run_import(chat_id, user_id, document):
+    """Скачивание и импорт файла в потоке importer.EXECUTOR"""
+    try:
+        data = bot.download_file(bot.get_file(document.file_id).file_path)
+        result = importer.import_file(storage, user_id, data, document.file_name or "")
+        bot.send_message(chat_id, result.report())
+    except Exception as e:
+        print(f"Ошибка импорта: {e}")
+        bot.send_message(chat_id, f"Не удалось импортировать файл: {e}")
+
+
+@router.command("stats")
+def stats(message):
+    """Метрики доставки напоминаний для администраторов"""
+    if message.from_user.id not in ADMIN_IDS:
+        bot.send_message(message.chat.id, "Команда доступна только администраторам.")
+        return
+    bot.send_message(message.chat.id, metrics.summary())
 
 
 if __name__ == "__main__":
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        print("Для режима webhook нужен WEBHOOK_SECRET")
+        raise SystemExit(1)
+    if os.getenv("METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("METRICS_PORT")))
     threading.Thread(target=schedule_checker, args=(bot,), daemon=True).start()
-    bot.infinity_polling()
+    if WEBHOOK_URL:
+        bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        webhook.serve(
+            create_application(),
+            port=int(os.getenv("WEBHOOK_PORT", webhook.DEFAULT_PORT)),
+        )
+    else:
+        bot.remove_webhook()
+        poll(bot, LaneExecutor())
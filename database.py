@@ -1,110 +1,483 @@
+import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+import migrations
+from metrics import CACHE_HITS, CACHE_MISSES
+
+DB_PATH = 'assistant.db'
+
+# Выполняются один раз при открытии соединения. auto_vacuum действует
+# только для новой базы (см. retention.py)
+CONNECTION_PRAGMAS = (
+    'PRAGMA auto_vacuum = INCREMENTAL',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -20000',
+    'PRAGMA mmap_size = 268435456',
+)
+
+_local = threading.local()
+
+
+def get_connection():
+    """Постоянное соединение текущего потока с базой DB_PATH.
+
+    У каждого потока своё соединение, которое открывается и настраивается
+    один раз; соединения завершившихся потоков закрываются вместе с их
+    threading.local.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(DB_PATH)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        connections[DB_PATH] = conn
+    return conn
+
+
+def close_connections():
+    """Закрытие соединений текущего потока"""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
 
 def init_db():
-    """Инициализация базы данных и создание таблиц, если они не существуют"""
-    conn = sqlite3.connect('assistant.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            created DATETIME,
-            timezone TEXT DEFAULT 'UTC'
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            text TEXT,
-            datetime DATETIME,
-            repeat TEXT,
-            is_active BOOLEAN DEFAULT 1,
-            FOREIGN KEY(user_id) REFERENCES users(user_id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS shopping_list (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            item TEXT,
-            category TEXT,
-            created DATETIME,
-            FOREIGN KEY(user_id) REFERENCES users(user_id)
-        )
-    ''')
+    """Инициализация базы данных: применение недостающих миграций схемы"""
+    migrations.migrate(get_connection())
+
 
-    conn.commit()
-    conn.close()
+def run_backfills(batch_size=1000):
+    """Фоновый перенос данных после миграций (см. migrations.BACKFILLS)"""
+    total = migrations.run_backfills(get_connection(), batch_size)
+    if total:
+        reminders_cache.clear()
+    return total
 
 
 class DB:
-    """Контекстный менеджер для работы с базой данных"""
+    """Контекстный менеджер для работы с базой данных.
+
+    Транзакция на постоянном соединении потока: фиксируется при выходе,
+    откатывается при исключении.
+    """
     def __enter__(self):
-        self.conn = sqlite3.connect('assistant.db')
-        return self.conn.cursor()
+        self.conn = get_connection()
+        self.cursor = self.conn.cursor()
+        return self.cursor
 
     def __exit__(self, type, value, traceback):
-        self.conn.commit()
-        self.conn.close()
+        self.cursor.close()
+        if type is None:
+            self.conn.commit()
+        else:
+            self.conn.rollback()
+
+
+# Сколько представлений (весь список, страницы) хранить на пользователя
+MAX_CACHED_VIEWS = 20
+
+
+class UserCache:
+    """Ограниченный LRU-кэш списков пользователя с TTL.
+
+    Ключ — user_id, значение — представления его списка: весь список
+    (view=None) и просмотренные страницы; инвалидация сбрасывает их
+    вместе. Запись, прочитанная из базы до инвалидации, в кэш
+    не попадёт: промах get регистрирует чтение и возвращает поколение
+    ключа, put сверяет его. Поколения хранятся только пока идут чтения
+    ключа, поэтому запись без чтений (планировщик, worker.py) не
+    оставляет в кэше следов.
+    """
+
+    def __init__(self, name, maxsize=None, ttl=None):
+        self.name = name
+        self.maxsize = maxsize or int(os.getenv('CACHE_SIZE', 10000))
+        self.ttl = ttl or float(os.getenv('CACHE_TTL', 60))
+        # user_id -> (срок, {представление: строки})
+        self._data = OrderedDict()
+        # user_id -> [незавершённых чтений, поколение]
+        self._reads = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, view=None):
+        """(True, значение) при попадании, иначе (False, поколение ключа).
+
+        После промаха нужно вызвать put или release.
+        """
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[user_id]
+                entry = None
+            if entry is not None and view in entry[1]:
+                self._data.move_to_end(user_id)
+                CACHE_HITS.inc(cache=self.name)
+                return True, entry[1][view]
+            CACHE_MISSES.inc(cache=self.name)
+            reads = self._reads.setdefault(user_id, [0, 0])
+            reads[0] += 1
+            return False, reads[1]
+
+    def _finish_read(self, user_id):
+        """Поколение ключа на момент завершения чтения"""
+        reads = self._reads.get(user_id)
+        if reads is None:
+            return None
+        reads[0] -= 1
+        if not reads[0]:
+            del self._reads[user_id]
+        return reads[1]
+
+    def put(self, user_id, value, generation, view=None):
+        with self._lock:
+            if self._finish_read(user_id) != generation:
+                return
+            entry = self._data.get(user_id)
+            if entry is None or entry[0] <= time.monotonic():
+                entry = self._data[user_id] = (time.monotonic() + self.ttl, {})
+            views = entry[1]
+            views.pop(view, None)
+            views[view] = value
+            while len(views) > MAX_CACHED_VIEWS:
+                del views[next(iter(views))]
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def release(self, user_id):
+        """Завершить чтение без записи в кэш (чтение не удалось)"""
+        with self._lock:
+            self._finish_read(user_id)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._data.pop(user_id, None)
+                reads = self._reads.get(user_id)
+                if reads is not None:
+                    reads[1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            for reads in self._reads.values():
+                reads[1] += 1
+
+    def stats(self):
+        return {
+            'size': len(self._data),
+            'hits': CACHE_HITS.get(cache=self.name),
+            'misses': CACHE_MISSES.get(cache=self.name),
+        }
+
+
+reminders_cache = UserCache('reminders')
+shopping_cache = UserCache('shopping_list')
+
+
+def _cached(cache, user_id, load, view=None):
+    hit, value = cache.get(user_id, view)
+    if hit:
+        return list(value)
+    try:
+        rows = load(user_id)
+    except Exception:
+        cache.release(user_id)
+        raise
+    cache.put(user_id, tuple(rows), value, view)
+    return rows
+
+
+def invalidate_reminders(*user_ids):
+    """Сброс кэша напоминаний после изменений в обход add_/delete_"""
+    reminders_cache.invalidate(*user_ids)
+
+
+# Подписчики на изменения напоминаний (например, планировщик)
+_reminder_listeners = []
+
+
+def subscribe_reminders(listener):
+    """Подписка на изменения напоминаний: listener(rem_id, due_at), None — удалено"""
+    _reminder_listeners.append(listener)
+
+
+def _notify_reminder(rem_id, due_at):
+    for listener in _reminder_listeners:
+        try:
+            listener(rem_id, due_at)
+        except Exception as e:
+            print(f"Ошибка подписчика напоминаний: {e}")
 
 
 # Добавляем недостающие функции работы с базой данных
+def to_epoch(dt):
+    """Наивное локальное время -> секунды UTC epoch"""
+    return int(dt.timestamp())
+
+
+# Срок напоминания для чтения. Пока фоновый перенос
+# (migrations.backfill_reminder_epochs) не дошёл до старой строки, у неё
+# есть только текстовая дата datetime — наивное локальное время
+DUE_AT = "COALESCE(due_at, CAST(strftime('%s', datetime, 'utc') AS INTEGER))"
+
+
+def _reminder_rows(rows):
+    """(id, текст, datetime, повтор); строки с нераспознанной датой пропускаются"""
+    return [
+        (rem_id, text, datetime.fromtimestamp(due_at), repeat)
+        for rem_id, text, due_at, repeat in rows
+        if due_at is not None
+    ]
+
+
 def add_reminder(user_id, text, dt, repeat=None):
     """Добавление напоминания в базу данных"""
+    due_at = to_epoch(dt)
     with DB() as cursor:
         cursor.execute(
-            'INSERT INTO reminders (user_id, text, datetime, repeat) VALUES (?, ?, ?, ?)',
-            (user_id, text, dt, repeat)
+            'INSERT INTO reminders (user_id, text, due_at, anchor_at, repeat) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (user_id, text, due_at, due_at, repeat)
+        )
+        rem_id = cursor.lastrowid
+    reminders_cache.invalidate(user_id)
+    _notify_reminder(rem_id, due_at)
+    return rem_id
+
+
+def add_reminders(user_id, rows):
+    """Добавление пачки напоминаний [(текст, datetime, повтор)] одной транзакцией.
+
+    Слушатели не уведомляются: планировщик подхватывает новые id
+    опросом (utils.NEW_ROWS_POLL).
+    """
+    with DB() as cursor:
+        cursor.executemany(
+            'INSERT INTO reminders (user_id, text, due_at, anchor_at, repeat) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [
+                (user_id, text, to_epoch(dt), to_epoch(dt), repeat)
+                for text, dt, repeat in rows
+            ]
         )
+    reminders_cache.invalidate(user_id)
 
 
 def get_reminders(user_id):
     """Получение всех активных напоминаний пользователя"""
+    return _cached(reminders_cache, user_id, _load_reminders)
+
+
+def _load_reminders(user_id):
     with DB() as cursor:
         cursor.execute(
-            'SELECT id, text, datetime, repeat FROM reminders WHERE user_id = ? AND is_active = 1',
+            f'SELECT id, text, {DUE_AT}, repeat FROM reminders '
+            'WHERE user_id = ? AND is_active = 1',
             (user_id,)
         )
-        return cursor.fetchall()
+        return _reminder_rows(cursor.fetchall())
+
+
+def iter_reminders(user_id, batch_size=1000):
+    """Активные напоминания пользователя по id, читаются пачками fetchmany"""
+    with DB() as cursor:
+        cursor.execute(
+            f'SELECT id, text, {DUE_AT}, repeat FROM reminders '
+            'WHERE user_id = ? AND is_active = 1 ORDER BY id',
+            (user_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from _reminder_rows(rows)
+
+
+def _keyset_page(query, params, after, before, limit):
+    """Строки по возрастанию id: следующие после after или предыдущие перед before"""
+    if before is not None:
+        query += ' AND id < ? ORDER BY id DESC LIMIT ?'
+        params = (*params, before, limit)
+    else:
+        query += ' AND id > ? ORDER BY id LIMIT ?'
+        params = (*params, after or 0, limit)
+    with DB() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    return rows[::-1] if before is not None else rows
+
+
+def iter_archived_reminders(user_id, batch_size=1000):
+    """Архивные напоминания пользователя (см. retention.py) пачками fetchmany"""
+    with DB() as cursor:
+        cursor.execute(
+            'SELECT id, text, due_at, repeat FROM reminders_archive '
+            'WHERE user_id = ? ORDER BY id',
+            (user_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for rem_id, text, due_at, repeat in rows:
+                yield rem_id, text, datetime.fromtimestamp(due_at), repeat
+
+
+def page_reminders(user_id, after=None, before=None, limit=10):
+    """Страница активных напоминаний пользователя по ключу id"""
+    return _cached(
+        reminders_cache, user_id,
+        lambda user_id: _page_reminders(user_id, after, before, limit),
+        view=('page', after, before, limit),
+    )
+
+
+def _page_reminders(user_id, after, before, limit):
+    return _reminder_rows(_keyset_page(
+        f'SELECT id, text, {DUE_AT}, repeat FROM reminders '
+        'WHERE user_id = ? AND is_active = 1',
+        (user_id,), after, before, limit
+    ))
+
+
+def fts_query(text):
+    """Запрос FTS5 из ввода пользователя: все слова, каждое как префикс"""
+    words = re.findall(r'\w+', text)
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search(user_id, text, limit=10):
+    """Поиск по напоминаниям и списку покупок: (напоминания, товары) по релевантности"""
+    query = fts_query(text)
+    if not query:
+        return [], []
+    # Условие на user_id — часть запроса FTS: ищем только среди его строк
+    query = f'user_id : "{int(user_id)}" AND ({query})'
+    with DB() as cursor:
+        cursor.execute(
+            f'SELECT r.id, r.text, {DUE_AT}, r.repeat '
+            'FROM reminders_fts JOIN reminders AS r ON r.id = reminders_fts.rowid '
+            'WHERE reminders_fts MATCH ? AND r.is_active = 1 '
+            'ORDER BY reminders_fts.rank LIMIT ?',
+            (query, limit)
+        )
+        reminders = _reminder_rows(cursor.fetchall())
+        cursor.execute(
+            'SELECT s.id, s.item, s.category, s.quantity '
+            'FROM shopping_fts JOIN shopping_list AS s ON s.id = shopping_fts.rowid '
+            'WHERE shopping_fts MATCH ? '
+            'ORDER BY shopping_fts.rank LIMIT ?',
+            (query, limit)
+        )
+        return reminders, cursor.fetchall()
 
 
 def delete_reminder(rem_id):
     """Удаление напоминания по ID"""
     with DB() as cursor:
+        cursor.execute('SELECT user_id FROM reminders WHERE id = ?', (rem_id,))
+        owners = [row[0] for row in cursor.fetchall()]
         cursor.execute('DELETE FROM reminders WHERE id = ?', (rem_id,))
+    reminders_cache.invalidate(*owners)
+    _notify_reminder(rem_id, None)
 
 
 def get_shopping_list(user_id):
     """Получение списка покупок пользователя"""
+    return _cached(shopping_cache, user_id, _load_shopping_list)
+
+
+def _load_shopping_list(user_id):
     with DB() as cursor:
         cursor.execute(
-            'SELECT id, item, category FROM shopping_list WHERE user_id = ?',
+            'SELECT id, item, category, quantity FROM shopping_list '
+            'WHERE user_id = ? ORDER BY id',
             (user_id,)
         )
         return cursor.fetchall()
 
 
-def add_shopping_item(user_id, item, category):
-    """Добавление товара в список покупок"""
+def iter_shopping_list(user_id, batch_size=1000):
+    """Список покупок пользователя по id, читается пачками fetchmany"""
     with DB() as cursor:
         cursor.execute(
-            'INSERT INTO shopping_list (user_id, item, category, created) VALUES (?, ?, ?, ?)',
-            (user_id, item, category, datetime.now())
+            'SELECT id, item, category, quantity FROM shopping_list '
+            'WHERE user_id = ? ORDER BY id',
+            (user_id,)
         )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+
+# Повторный товар увеличивает количество (уникальный индекс idx_shopping_list_item)
+ADD_SHOPPING_ITEM_QUERY = '''
+    INSERT INTO shopping_list (user_id, item, category, quantity, created)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, item, category)
+    DO UPDATE SET quantity = quantity + excluded.quantity
+'''
+
+
+def add_shopping_item(user_id, item, category, quantity=1):
+    """Добавление товара в список покупок"""
+    add_shopping_items(user_id, [(item, category, quantity)])
+
+
+def page_shopping_list(user_id, after=None, before=None, limit=10):
+    """Страница списка покупок пользователя по ключу id"""
+    return _cached(
+        shopping_cache, user_id,
+        lambda user_id: _keyset_page(
+            'SELECT id, item, category, quantity FROM shopping_list '
+            'WHERE user_id = ?',
+            (user_id,), after, before, limit
+        ),
+        view=('page', after, before, limit),
+    )
+
+
+def add_shopping_items(user_id, rows):
+    """Добавление товаров [(название, категория, количество)] одной транзакцией"""
+    created = datetime.now()
+    with DB() as cursor:
+        cursor.executemany(
+            ADD_SHOPPING_ITEM_QUERY,
+            [
+                (user_id, item, category, quantity, created)
+                for item, category, quantity in rows
+            ]
+        )
+    shopping_cache.invalidate(user_id)
 
 
 def delete_shopping_item(item_id):
     """Удаление товара из списка покупок по ID"""
     with DB() as cursor:
+        cursor.execute(
+            'SELECT user_id FROM shopping_list WHERE id = ?', (item_id,)
+        )
+        owners = [row[0] for row in cursor.fetchall()]
         cursor.execute('DELETE FROM shopping_list WHERE id = ?', (item_id,))
+    shopping_cache.invalidate(*owners)
 
 
 def delete_all_shopping_items(user_id):
     """Удаление всех товаров пользователя"""
     with DB() as cursor:
         cursor.execute('DELETE FROM shopping_list WHERE user_id = ?', (user_id,))
+    shopping_cache.invalidate(user_id)
+
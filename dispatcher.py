@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telebot.apihelper import ApiTelegramException  # type: ignore
+
+from metrics import MESSAGES_FAILED, MESSAGES_SENT, error_class
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 30
+DEFAULT_CHAT_RATE = 1
+DEFAULT_CHAT_BURST = 3
+MAX_RETRIES = 3
+# Окно, за которое считается скорость доставки
+THROUGHPUT_WINDOW = 60
+# При таком числе корзин чатов простаивающие удаляются
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Потокобезопасная корзина токенов"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def acquire(self):
+        """Дождаться и забрать один токен"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(
+                    self.paused_until - now, (1 - self.tokens) / self.rate
+                )
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Не выдавать токены заданное время (ответ 429 retry_after)"""
+        with self._lock:
+            self.paused_until = max(
+                self.paused_until, time.monotonic() + seconds
+            )
+
+    def is_idle(self, now):
+        with self._lock:
+            self._refill(now)
+            return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class MessageDispatcher:
+    """Параллельная отправка сообщений с глобальным и початовым лимитом.
+
+    Параметры по умолчанию берутся из переменных окружения SEND_WORKERS,
+    SEND_RATE и SEND_CHAT_RATE.
+    """
+
+    def __init__(self, bot_instance, workers=None, rate=None, chat_rate=None):
+        self.bot = bot_instance
+        self.workers = workers or int(
+            os.getenv('SEND_WORKERS', DEFAULT_WORKERS)
+        )
+        self.chat_rate = chat_rate or float(
+            os.getenv('SEND_CHAT_RATE', DEFAULT_CHAT_RATE)
+        )
+        self.global_bucket = TokenBucket(
+            rate or float(os.getenv('SEND_RATE', DEFAULT_RATE))
+        )
+        self._chat_buckets = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='dispatcher'
+        )
+        self._sent_at = deque()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self._chat_buckets) >= MAX_CHAT_BUCKETS:
+                    now = time.monotonic()
+                    self._chat_buckets = {
+                        key: value
+                        for key, value in self._chat_buckets.items()
+                        if not value.is_idle(now)
+                    }
+                bucket = TokenBucket(self.chat_rate, DEFAULT_CHAT_BURST)
+                self._chat_buckets[chat_id] = bucket
+            return bucket
+
+    def send(self, chat_id, text):
+        """Отправка одного сообщения с учётом лимитов.
+
+        Возвращает None, если сообщение доставлено, иначе исключение.
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(MAX_RETRIES + 1):
+            chat_bucket.acquire()
+            self.global_bucket.acquire()
+            try:
+                self.bot.send_message(chat_id, text)
+            except ApiTelegramException as e:
+                error = e
+                if e.error_code != 429 or attempt == MAX_RETRIES:
+                    break
+                retry_after = (e.result_json or {}).get(
+                    'parameters', {}
+                ).get('retry_after', 1)
+                chat_bucket.pause(retry_after)
+                self.global_bucket.pause(retry_after)
+                with self._lock:
+                    self.retried += 1
+            except Exception as e:
+                error = e
+                break
+            else:
+                now = time.monotonic()
+                MESSAGES_SENT.inc()
+                with self._lock:
+                    self.sent += 1
+                    self._sent_at.append(now)
+                    self._trim(now)
+                return None
+        print(f"Ошибка отправки: {error}")
+        MESSAGES_FAILED.inc(error=error_class(error))
+        with self._lock:
+            self.failed += 1
+        return error
+
+    def run_workers(self, function):
+        """function() в каждом потоке пула, список результатов"""
+        futures = [self._pool.submit(function) for _ in range(self.workers)]
+        return [future.result() for future in futures]
+
+    def _trim(self, now):
+        while self._sent_at and self._sent_at[0] < now - THROUGHPUT_WINDOW:
+            self._sent_at.popleft()
+
+    def throughput(self):
+        """Доставлено сообщений в секунду за последнее окно"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return len(self._sent_at) / THROUGHPUT_WINDOW
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'per_second': self.throughput(),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,122 @@
+"""Выгрузка данных пользователя в CSV или JSON Lines.
+
+Строки приходят из хранилища пачками и сразу пишутся во временный
+файл: до SPOOL_SIZE он держится в памяти, дальше уходит на диск.
+Файлы больше COMPRESS_THRESHOLD сжимаются gzip. Расход памяти не
+зависит от числа строк.
+"""
+import codecs
+import csv
+import gzip
+import json
+import os
+import shutil
+from tempfile import SpooledTemporaryFile
+
+FORMATS = ('csv', 'jsonl')
+SPOOL_SIZE = 1024 * 1024
+COMPRESS_THRESHOLD = int(os.getenv('EXPORT_COMPRESS_THRESHOLD', 256 * 1024))
+DATE_FORMAT = '%d.%m.%Y %H:%M'
+
+# Колонки: ключ записи JSONL и заголовок CSV
+REMINDER_COLUMNS = (
+    ('id', 'ID'), ('text', 'Текст'), ('date', 'Дата'), ('repeat', 'Повтор')
+)
+SHOPPING_COLUMNS = (
+    ('id', 'ID'), ('item', 'Товар'), ('category', 'Категория'),
+    ('quantity', 'Количество'),
+)
+# Пустое значение в CSV (в JSONL — null)
+CSV_EMPTY = 'нет'
+
+
+class ExportFile:
+    """Готовый файл выгрузки: имя, открытый файл и число строк"""
+
+    def __init__(self, filename, file, rows):
+        self.filename = filename
+        self.file = file
+        self.rows = rows
+
+    def close(self):
+        self.file.close()
+
+
+def reminder_records(reminders):
+    for rem_id, text, dt, repeat in reminders:
+        yield {
+            'id': rem_id,
+            'text': text,
+            'date': dt.strftime(DATE_FORMAT),
+            'repeat': repeat,
+        }
+
+
+def shopping_records(items):
+    for item_id, item, category, quantity in items:
+        yield {
+            'id': item_id, 'item': item, 'category': category,
+            'quantity': quantity,
+        }
+
+
+def write_records(out, records, columns, fmt):
+    """Запись в текстовый поток, возвращает число строк"""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow([title for _, title in columns])
+        for record in records:
+            writer.writerow([
+                CSV_EMPTY if record[key] is None else record[key]
+                for key, _ in columns
+            ])
+            count += 1
+    else:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def _compress(spool):
+    spool.seek(0)
+    packed = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    with gzip.GzipFile(fileobj=packed, mode='wb') as archive:
+        shutil.copyfileobj(spool, archive)
+    spool.close()
+    return packed
+
+
+def export_records(name, records, columns, fmt='csv', threshold=None):
+    """Выгрузка записей в файл name.<fmt>[.gz].
+
+    Возвращает ExportFile, указатель файла — в начале.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
+    if threshold is None:
+        threshold = COMPRESS_THRESHOLD
+    spool = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    rows = write_records(
+        codecs.getwriter('utf-8')(spool), records, columns, fmt
+    )
+    filename = f'{name}.{fmt}'
+    if spool.tell() > threshold:
+        spool = _compress(spool)
+        filename += '.gz'
+    spool.seek(0)
+    return ExportFile(filename, spool, rows)
+
+
+def export_reminders(reminders, fmt='csv', threshold=None, name='reminders'):
+    return export_records(
+        name, reminder_records(reminders), REMINDER_COLUMNS, fmt, threshold
+    )
+
+
+def export_shopping_list(items, fmt='csv', threshold=None):
+    return export_records(
+        'shopping_list', shopping_records(items), SHOPPING_COLUMNS,
+        fmt, threshold
+    )
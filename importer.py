@@ -0,0 +1,195 @@
+"""Загрузка напоминаний и списка покупок из файлов /export.
+
+Файл (CSV или JSON Lines, можно сжатый gzip) разбирается потоково:
+каждая строка проверяется сразу, корректные копятся до CHUNK_SIZE
+и записываются в хранилище одной транзакцией. Ошибочные строки
+пропускаются и попадают в отчёт. Id из файла не переносятся — записи
+получают новые.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from export import (
+    CSV_EMPTY, DATE_FORMAT, REMINDER_COLUMNS, SHOPPING_COLUMNS
+)
+from recurrence import compile_rule
+
+CHUNK_SIZE = 1000
+# Лимит Bot API на скачивание файлов ботом
+MAX_FILE_SIZE = 20 * 1024 * 1024
+# Сколько ошибок перечислять в отчёте
+MAX_REPORTED_ERRORS = 20
+DEFAULT_CATEGORY = 'Без категории'
+
+# Импорт идёт вне потоков обработчиков, чтобы не задерживать polling
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('IMPORT_WORKERS', 1)),
+    thread_name_prefix='import',
+)
+
+
+class ImportResult:
+
+    def __init__(self, kind=None):
+        self.kind = kind
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, error):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, error))
+
+    def report(self):
+        """Отчёт для пользователя"""
+        title = {
+            'reminders': 'напоминаний', 'shopping_list': 'товаров'
+        }.get(self.kind, 'записей')
+        lines = [f'Импортировано {title}: {self.imported}']
+        if self.error_count:
+            lines.append(f'Пропущено строк с ошибками: {self.error_count}')
+            lines.extend(f'строка {line}: {error}' for line, error in self.errors)
+            if self.error_count > len(self.errors):
+                lines.append('…')
+        return '\n'.join(lines)
+
+
+def _empty(value):
+    return value is None or str(value).strip() in ('', CSV_EMPTY)
+
+
+def parse_reminder(record, now):
+    """(текст, datetime, повтор) из записи; ValueError при ошибке"""
+    text = record.get('text')
+    if _empty(text):
+        raise ValueError('пустой текст')
+    try:
+        dt = datetime.strptime(str(record.get('date')).strip(), DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f'дата не в формате ДД.ММ.ГГГГ ЧЧ:ММ: {record.get("date")}')
+    if dt < now - timedelta(minutes=1):
+        raise ValueError('дата в прошлом')
+    repeat = None if _empty(record.get('repeat')) else str(record['repeat']).strip()
+    if repeat is not None:
+        try:
+            compile_rule(repeat, int(dt.timestamp()))
+        except Exception:
+            raise ValueError(f'неизвестная периодичность: {repeat}')
+    return str(text), dt, repeat
+
+
+def parse_shopping_item(record, now):
+    """(название, категория, количество) из записи; ValueError при ошибке"""
+    item = record.get('item')
+    if _empty(item):
+        raise ValueError('пустое название товара')
+    category = record.get('category')
+    quantity = record.get('quantity')
+    try:
+        quantity = 1 if _empty(quantity) else int(quantity)
+    except (TypeError, ValueError):
+        raise ValueError(f'количество не число: {quantity}')
+    if quantity < 1:
+        raise ValueError('количество должно быть положительным')
+    return (
+        str(item).strip(),
+        DEFAULT_CATEGORY if _empty(category) else str(category).strip(),
+        quantity,
+    )
+
+
+KINDS = {
+    'reminders': (REMINDER_COLUMNS, parse_reminder, 'add_reminders'),
+    'shopping_list': (SHOPPING_COLUMNS, parse_shopping_item, 'add_shopping_items'),
+}
+
+
+def detect_kind(fields):
+    """Тип данных по набору колонок или ключей"""
+    for kind, (columns, _, _) in KINDS.items():
+        required = {
+            key for key, _ in columns if key not in ('id', 'quantity')
+        }
+        if required <= set(fields):
+            return kind
+    raise ValueError('Не удалось определить содержимое файла по колонкам')
+
+
+def open_text(data):
+    """Текстовый поток из байтов файла, gzip распаковывается на лету"""
+    raw = io.BytesIO(data)
+    if data[:2] == b'\x1f\x8b':
+        raw = gzip.GzipFile(fileobj=raw)
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+
+def iter_csv(stream):
+    """(номер строки, тип, запись) из CSV с заголовком /export"""
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    titles = {}
+    for columns, _, _ in KINDS.values():
+        titles.update({title: key for key, title in columns})
+    fields = [titles.get(name.strip(), name.strip()) for name in header]
+    kind = detect_kind(fields)
+    for row in reader:
+        if row:
+            yield reader.line_num, kind, dict(zip(fields, row))
+
+
+def iter_jsonl(stream):
+    """(номер строки, тип, запись) из JSON Lines; ошибочная строка — исключение"""
+    kind = None
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_num, kind, ValueError('строка не является JSON')
+            continue
+        if not isinstance(record, dict):
+            yield line_num, kind, ValueError('ожидается JSON-объект')
+            continue
+        if kind is None:
+            kind = detect_kind(record)
+        yield line_num, kind, record
+
+
+def import_file(storage, user_id, data, filename='', chunk_size=CHUNK_SIZE):
+    """Импорт файла /export в хранилище, возвращает ImportResult"""
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    rows = iter_jsonl if name.endswith('.jsonl') else iter_csv
+    now = datetime.now()
+    result, chunk, add = ImportResult(), [], None
+    for line_num, kind, record in rows(open_text(data)):
+        if isinstance(record, Exception):
+            result.add_error(line_num, record)
+            continue
+        if add is None:
+            result.kind = kind
+            _, parse, method = KINDS[kind]
+            add = getattr(storage, method)
+        try:
+            chunk.append(parse(record, now))
+        except ValueError as e:
+            result.add_error(line_num, e)
+            continue
+        if len(chunk) >= chunk_size:
+            add(user_id, chunk)
+            result.imported += len(chunk)
+            chunk = []
+    if chunk:
+        add(user_id, chunk)
+        result.imported += len(chunk)
+    return result
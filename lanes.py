@@ -0,0 +1,143 @@
+"""Обработка обновлений по полосам: по порядку для пользователя,
+параллельно для разных пользователей.
+
+Обновление попадает в одну из UPDATE_LANES полос по id отправителя.
+У каждой полосы своя ограниченная очередь и один поток, поэтому шаги
+диалога одного пользователя выполняются строго по очереди, а
+медленная запись в базу задерживает только его полосу.
+"""
+import os
+import queue
+import threading
+import time
+
+from metrics import LANE_BUSY, LANE_MAX_DEPTH, LANE_QUEUE_DEPTH, LANE_SATURATED
+
+DEFAULT_LANES = 8
+# Обновлений, ожидающих в одной полосе
+DEFAULT_QUEUE_SIZE = 100
+# Поля Update, из которых берётся отправитель
+USER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+    'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+POLL_TIMEOUT = 20
+# Пауза после ошибки getUpdates, сек
+POLL_RETRY_DELAY = 3
+
+_STOP = object()
+
+
+def update_key(update):
+    """Id отправителя обновления, иначе update_id"""
+    for field in USER_FIELDS:
+        value = getattr(update, field, None)
+        # У poll_answer отправитель в поле user
+        user = getattr(value, 'from_user', None) or getattr(value, 'user', None)
+        if user is not None:
+            return user.id
+    return update.update_id
+
+
+class LaneExecutor:
+
+    def __init__(self, lanes=None, queue_size=None):
+        lanes = lanes or int(os.getenv('UPDATE_LANES', DEFAULT_LANES))
+        queue_size = queue_size or int(
+            os.getenv('LANE_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        )
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(lanes)]
+        self.busy = [False] * lanes
+        self.stopped = False
+        self.threads = [
+            threading.Thread(
+                target=self._run, args=(index,),
+                name=f'lane-{index}', daemon=True,
+            )
+            for index in range(lanes)
+        ]
+        for thread in self.threads:
+            thread.start()
+        LANE_QUEUE_DEPTH.set_function(lambda: sum(self.depths()))
+        LANE_MAX_DEPTH.set_function(lambda: max(self.depths()))
+        LANE_BUSY.set_function(lambda: sum(self.busy))
+
+    def lane(self, key):
+        return hash(key) % len(self.queues)
+
+    def depths(self):
+        return [lane.qsize() for lane in self.queues]
+
+    def submit(self, key, function, *args, block=True):
+        """Поставить function(*args) в полосу key.
+
+        Если очередь полосы полна, block=True ждёт места, иначе
+        возвращает False.
+        """
+        if self.stopped:
+            return False
+        lane = self.queues[self.lane(key)]
+        if lane.full():
+            LANE_SATURATED.inc()
+        try:
+            lane.put((function, args), block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self, index):
+        lane = self.queues[index]
+        while True:
+            task = lane.get()
+            if task is _STOP:
+                return
+            function, args = task
+            self.busy[index] = True
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Ошибка обработки обновления: {e}")
+            finally:
+                self.busy[index] = False
+
+    def process_updates(self, bot, updates, block=True):
+        """Раздать обновления по полосам, возвращает число непринятых"""
+        rejected = 0
+        for update in updates:
+            if not self.submit(
+                update_key(update), bot.process_new_updates, [update],
+                block=block,
+            ):
+                rejected += 1
+        return rejected
+
+    def shutdown(self, wait=True):
+        """Остановить полосы после уже принятых обновлений"""
+        self.stopped = True
+        for lane in self.queues:
+            lane.put(_STOP)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+def poll(bot, lanes, timeout=POLL_TIMEOUT):
+    """Long polling, раздающий обновления по полосам.
+
+    Замена bot.infinity_polling: когда полоса заполнена, приём
+    следующих обновлений ждёт её.
+    """
+    offset = None
+    while True:
+        try:
+            updates = bot.get_updates(
+                offset=offset, timeout=timeout, long_polling_timeout=timeout
+            )
+        except Exception as e:
+            print(f"Ошибка получения обновлений: {e}")
+            time.sleep(POLL_RETRY_DELAY)
+            continue
+        if updates:
+            offset = updates[-1].update_id + 1
+            lanes.process_updates(bot, updates)
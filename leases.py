@@ -0,0 +1,111 @@
+import math
+import os
+import socket
+import time
+import uuid
+from database import DB
+
+# Число шардов должно совпадать у всех процессов планировщика
+DEFAULT_SHARDS = 16
+# Срок аренды шарда и интервал её продления, сек
+LEASE_TTL = 30
+LEASE_RENEW = 10
+
+
+def shard_filter(shards, shard_count, column='user_id'):
+    """SQL-условие и параметры «строка принадлежит одному из шардов»"""
+    placeholders = ', '.join('?' * len(shards))
+    return (
+        f'{column} % ? IN ({placeholders})',
+        [shard_count, *sorted(shards)]
+    )
+
+
+class ShardLeases:
+    """Аренда шардов напоминаний процессом планировщика.
+
+    Напоминание относится к шарду user_id % shard_count. Каждый процесс
+    отмечается в scheduler_workers и держит примерно равную долю шардов
+    в scheduler_leases; если процесс перестал продлевать аренду, его
+    шарды по истечении LEASE_TTL забирают остальные.
+    """
+
+    def __init__(self, shard_count=None, owner=None, ttl=LEASE_TTL):
+        self.shard_count = shard_count or int(
+            os.getenv('SCHEDULER_SHARDS', DEFAULT_SHARDS)
+        )
+        self.owner = owner or (
+            f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        )
+        self.ttl = ttl
+        self.owned = set()
+
+    def refresh(self):
+        """Продление, захват и балансировка аренды.
+
+        Возвращает множество шардов, полученных в этот раз.
+        """
+        now = time.time()
+        lease_until = now + self.ttl
+        with DB() as cursor:
+            # Все процессы читают и меняют аренду по очереди
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.executemany(
+                'INSERT OR IGNORE INTO scheduler_leases (shard, lease_until) '
+                'VALUES (?, 0)',
+                [(shard,) for shard in range(self.shard_count)]
+            )
+            cursor.execute(
+                'INSERT OR REPLACE INTO scheduler_workers (owner, seen_until) '
+                'VALUES (?, ?)',
+                (self.owner, lease_until)
+            )
+            cursor.execute(
+                'DELETE FROM scheduler_workers WHERE seen_until < ?', (now,)
+            )
+            cursor.execute('SELECT COUNT(*) FROM scheduler_workers')
+            target = math.ceil(self.shard_count / cursor.fetchone()[0])
+
+            cursor.execute(
+                'SELECT shard, owner, lease_until FROM scheduler_leases '
+                'WHERE shard < ? ORDER BY shard',
+                (self.shard_count,)
+            )
+            mine, free = [], []
+            for shard, owner, until in cursor.fetchall():
+                if owner == self.owner and until > now:
+                    mine.append(shard)
+                elif until <= now:
+                    free.append(shard)
+            while len(mine) < target and free:
+                mine.append(free.pop(0))
+            released = mine[target:]
+            mine = mine[:target]
+
+            cursor.executemany(
+                'UPDATE scheduler_leases SET owner = ?, lease_until = ? '
+                'WHERE shard = ?',
+                [(self.owner, lease_until, shard) for shard in mine]
+            )
+            cursor.executemany(
+                'UPDATE scheduler_leases SET owner = NULL, lease_until = 0 '
+                'WHERE shard = ?',
+                [(shard,) for shard in released]
+            )
+
+        acquired = set(mine) - self.owned
+        self.owned = set(mine)
+        return acquired
+
+    def release(self):
+        """Освобождение аренды при штатной остановке"""
+        with DB() as cursor:
+            cursor.execute(
+                'UPDATE scheduler_leases SET owner = NULL, lease_until = 0 '
+                'WHERE owner = ?',
+                (self.owner,)
+            )
+            cursor.execute(
+                'DELETE FROM scheduler_workers WHERE owner = ?', (self.owner,)
+            )
+        self.owned = set()
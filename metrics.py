@@ -0,0 +1,269 @@
+"""Метрики доставки напоминаний в текстовом формате Prometheus."""
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REGISTRY = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n')
+        )
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self):
+        """Пары (имя с метками, значение)"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        lines.extend(f'{name} {value}' for name, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Счётчик, опционально с метками: inc(error='...')"""
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items()) or [((), 0)]
+        return [(self.name + _format_labels(key), value)
+                for key, value in items]
+
+
+class Gauge(Metric):
+    """Значение, заданное явно или вычисляемое при чтении"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self.value = 0
+        self._function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception as e:
+                print(f"Ошибка метрики {self.name}: {e}")
+                return math.nan
+        return self.value
+
+    def samples(self):
+        return [(self.name, self.get())]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    def quantile(self, q):
+        """Оценка квантиля сверху — граница корзины, в которую он попал"""
+        with self._lock:
+            if not self.count:
+                return None
+            threshold = q * self.count
+            total = 0
+            for bound, count in zip(self.buckets, self.counts):
+                total += count
+                if total >= threshold:
+                    return bound
+        return math.inf
+
+    def samples(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = '+Inf' if bound == math.inf else repr(bound)
+            samples.append((f'{self.name}_bucket{{le="{le}"}}', cumulative))
+        samples.append((f'{self.name}_sum', total))
+        samples.append((f'{self.name}_count', count))
+        return samples
+
+
+DELIVERY_DELAY = Histogram(
+    'reminder_delivery_delay_seconds',
+    'Задержка от срока напоминания до отправки сообщения',
+    (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 3600),
+)
+TICK_DURATION = Histogram(
+    'scheduler_tick_seconds',
+    'Длительность постановки наступивших напоминаний в outbox',
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+DISPATCH_DURATION = Histogram(
+    'bot_dispatch_seconds',
+    'Выбор обработчика и обработка одного обновления Telegram',
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+QUEUE_DEPTH = Gauge(
+    'scheduler_queue_depth', 'Напоминаний в очереди планировщика'
+)
+OUTBOX_PENDING = Gauge(
+    'outbox_pending', 'Уведомлений в outbox, ожидающих отправки'
+)
+MESSAGES_SENT = Counter('messages_sent_total', 'Отправлено сообщений')
+MESSAGES_FAILED = Counter(
+    'messages_failed_total', 'Неудачные отправки по классу ошибки'
+)
+CACHE_HITS = Counter(
+    'db_cache_hits_total', 'Попадания в кэш списков пользователя'
+)
+CACHE_MISSES = Counter(
+    'db_cache_misses_total', 'Промахи кэша списков пользователя'
+)
+ARCHIVED_REMINDERS = Counter(
+    'reminders_archived_total', 'Напоминаний перенесено в архив'
+)
+RECLAIMED_BYTES = Counter(
+    'database_reclaimed_bytes_total', 'Место, возвращённое incremental_vacuum'
+)
+WEBHOOK_UPDATES = Counter(
+    'webhook_updates_total', 'Обновления, полученные webhook, по результату'
+)
+LANE_QUEUE_DEPTH = Gauge(
+    'update_lane_queue_depth', 'Обновлений в очередях всех полос'
+)
+LANE_MAX_DEPTH = Gauge(
+    'update_lane_max_depth', 'Обновлений в самой загруженной полосе'
+)
+LANE_BUSY = Gauge('update_lanes_busy', 'Полос, обрабатывающих обновление')
+LANE_SATURATED = Counter(
+    'update_lane_saturated_total', 'Обновления, заставшие очередь полосы полной'
+)
+SEND_RATE = Gauge(
+    'messages_sent_per_second',
+    'Скорость отправки за последнюю минуту, сообщений в секунду'
+)
+
+
+def error_class(error):
+    """Класс ошибки для метки: имя исключения и код ответа Telegram"""
+    code = getattr(error, 'error_code', None)
+    name = type(error).__name__
+    return f'{name}:{code}' if code is not None else name
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def summary():
+    """Краткая сводка для команды /stats"""
+    def seconds(value):
+        return '—' if value is None else f'≤ {value} с'
+
+    failures = ', '.join(
+        f'{dict(key)["error"]}: {value}'
+        for key, value in sorted(MESSAGES_FAILED.values.items())
+    ) or 'нет'
+    cache_lines = ', '.join(
+        f'{cache} {CACHE_HITS.get(cache=cache)}/'
+        f'{CACHE_HITS.get(cache=cache) + CACHE_MISSES.get(cache=cache)}'
+        for cache in ('reminders', 'shopping_list')
+    )
+    tick_avg = (
+        TICK_DURATION.sum / TICK_DURATION.count * 1000
+        if TICK_DURATION.count else 0
+    )
+    return (
+        f'Отправлено: {MESSAGES_SENT.get()} '
+        f'({SEND_RATE.get():.2f} в секунду)\n'
+        f'Ошибки отправки: {failures}\n'
+        f'Задержка доставки: p50 {seconds(DELIVERY_DELAY.quantile(0.5))}, '
+        f'p99 {seconds(DELIVERY_DELAY.quantile(0.99))} '
+        f'(всего {DELIVERY_DELAY.count})\n'
+        f'Тик планировщика: в среднем {tick_avg:.1f} мс\n'
+        f'Обработка обновления: p50 {seconds(DISPATCH_DURATION.quantile(0.5))}, '
+        f'p99 {seconds(DISPATCH_DURATION.quantile(0.99))}\n'
+        f'Полосы обновлений: в очередях {LANE_QUEUE_DEPTH.get()}, '
+        f'максимум {LANE_MAX_DEPTH.get()}, заняты {LANE_BUSY.get()}, '
+        f'переполнений {LANE_SATURATED.get()}\n'
+        f'Очередь планировщика: {QUEUE_DEPTH.get()}\n'
+        f'Ожидают отправки: {OUTBOX_PENDING.get()}\n'
+        f'Кэш: {cache_lines}\n'
+        f'Архив: перенесено {ARCHIVED_REMINDERS.get()}, '
+        f'освобождено {RECLAIMED_BYTES.get() // 1024} КБ'
+    )
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr='127.0.0.1'):
+    """HTTP-эндпоинт /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
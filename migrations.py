@@ -0,0 +1,475 @@
+"""Версионные миграции схемы базы данных.
+
+Номер применённой миграции хранится в PRAGMA user_version. Каждая
+миграция выполняется в своей транзакции вместе с повышением версии,
+поэтому прерванная миграция не оставляет схему в промежуточном
+состоянии. Миграции с номером 1 и выше совместимы с базами, созданными
+прежним init_db (CREATE ... IF NOT EXISTS).
+
+Перенос данных в больших таблицах вынесен в BACKFILLS: они идут
+короткими пачками в фоновом потоке планировщика, пока бот обслуживает
+сообщения, и после перезапуска продолжаются с места остановки. До
+переноса чтение берёт срок из старой колонки (database.DUE_AT).
+"""
+from datetime import datetime
+
+
+def _add_missing_columns(cursor, table, columns):
+    """Добавление колонок, которых нет в таблице из старой версии"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = [column[1] for column in cursor.fetchall()]
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+
+def _base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            created DATETIME,
+            timezone TEXT DEFAULT 'UTC'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            text TEXT,
+            datetime DATETIME,
+            repeat TEXT,
+            is_active BOOLEAN DEFAULT 1,
+            due_at INTEGER,
+            anchor_at INTEGER,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+    # Срок напоминания хранится в due_at (секунды UTC epoch); текстовая
+    # колонка datetime осталась от старых версий и переносится в due_at
+    # фоновым backfill_reminder_epochs. anchor_at — исходный срок,
+    # от которого считаются календарные повторы
+    _add_missing_columns(
+        cursor, 'reminders', {'due_at': 'INTEGER', 'anchor_at': 'INTEGER'}
+    )
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shopping_list (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            item TEXT,
+            category TEXT,
+            created DATETIME,
+            FOREIGN KEY(user_id) REFERENCES users(user_id)
+        )
+    ''')
+
+
+def _reminder_due_index(cursor):
+    # Покрывающий индекс для выборки наступивших напоминаний планировщиком;
+    # user_id в индексе нужен для отбора по шардам без чтения таблицы
+    cursor.execute('DROP INDEX IF EXISTS idx_reminders_due')
+    cursor.execute('DROP INDEX IF EXISTS idx_reminders_due_at')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_due_shard
+        ON reminders (is_active, due_at, user_id)
+    ''')
+
+
+def _outbox(cursor):
+    # Очередь исходящих уведомлений: «напоминание наступило» отделено
+    # от «сообщение отправлено». Статусы: pending, sending, sent, dead
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT UNIQUE,
+            reminder_id INTEGER,
+            due_at INTEGER,
+            chat_id INTEGER,
+            text TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            created REAL
+        )
+    ''')
+
+    _add_missing_columns(cursor, 'outbox', {'due_at': 'INTEGER'})
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (status, next_attempt_at)
+    ''')
+
+
+def _scheduler_leases(cursor):
+    # Аренда шардов напоминаний процессами планировщика (leases.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_leases (
+            shard INTEGER PRIMARY KEY,
+            owner TEXT,
+            lease_until REAL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_workers (
+            owner TEXT PRIMARY KEY,
+            seen_until REAL
+        )
+    ''')
+
+
+def _user_lookup_indexes(cursor):
+    # Списки пользователя в обработчиках выбираются по user_id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shopping_list_user
+        ON shopping_list (user_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_user
+        ON reminders (user_id, is_active)
+    ''')
+
+
+def _shopping_quantity(cursor):
+    # Повторно добавленный товар хранится одной строкой с количеством:
+    # существующие дубли складываются, уникальный индекс нужен для UPSERT
+    # и заменяет индекс по user_id
+    _add_missing_columns(
+        cursor, 'shopping_list', {'quantity': 'INTEGER DEFAULT 1'}
+    )
+    cursor.execute('''
+        UPDATE shopping_list SET quantity = (
+            SELECT SUM(COALESCE(dup.quantity, 1)) FROM shopping_list AS dup
+            WHERE dup.user_id IS shopping_list.user_id
+              AND dup.item IS shopping_list.item
+              AND dup.category IS shopping_list.category
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM shopping_list
+            GROUP BY user_id, item, category HAVING COUNT(*) > 1
+        )
+    ''')
+    cursor.execute('''
+        DELETE FROM shopping_list WHERE id NOT IN (
+            SELECT MIN(id) FROM shopping_list GROUP BY user_id, item, category
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_shopping_list_item
+        ON shopping_list (user_id, item, category)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_shopping_list_user')
+
+
+def _shopping_page_index(cursor):
+    # Постраничный просмотр списка покупок идёт по ключу id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shopping_list_page
+        ON shopping_list (user_id, id)
+    ''')
+
+
+def _reminders_archive(cursor):
+    # Отработавшие разовые напоминания переносит сюда retention.py,
+    # чтобы таблица reminders не росла бесконечно
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            text TEXT,
+            due_at INTEGER,
+            repeat TEXT,
+            anchor_at INTEGER,
+            archived_at INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_archive_user
+        ON reminders_archive (user_id, id)
+    ''')
+
+
+FTS_TOKENIZE = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+
+def _fts_triggers(cursor, table, fts, columns):
+    """Триггеры, переносящие изменения колонок columns таблицы в индекс fts"""
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = (
+        f"INSERT INTO {fts} ({fts}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    insert = f'INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});'
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+        BEGIN {insert} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+        BEGIN {delete} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_update
+        AFTER UPDATE OF {names} ON {table}
+        BEGIN {delete} {insert} END
+    ''')
+
+
+def _full_text_search(cursor):
+    # Полнотекстовый поиск для /find. Индексы FTS5 ссылаются на строки
+    # основных таблиц (external content) и обновляются триггерами;
+    # изменения срока и количества индекс не трогают. Миграция 11
+    # заменяет эти индексы, поэтому здесь они не заполняются
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS reminders_fts USING fts5(
+            text, content = 'reminders', content_rowid = 'id', {FTS_TOKENIZE}
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS shopping_fts USING fts5(
+            item, category, content = 'shopping_list', content_rowid = 'id',
+            {FTS_TOKENIZE}
+        )
+    ''')
+    _fts_triggers(cursor, 'reminders', 'reminders_fts', ('text',))
+    _fts_triggers(
+        cursor, 'shopping_list', 'shopping_fts', ('item', 'category')
+    )
+
+
+def _user_states(cursor):
+    # Состояние диалогов для states.SQLiteStateStore
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT,
+            expires_at REAL
+        )
+    ''')
+
+
+# Индексы поиска с владельцем: (индекс, таблица, колонки)
+FTS_INDEXES = (
+    ('reminders_fts', 'reminders', ('user_id', 'text')),
+    ('shopping_fts', 'shopping_list', ('user_id', 'item', 'category')),
+)
+
+
+def _full_text_search_by_user(cursor):
+    # Поиск ограничивается строками пользователя в самом запросе FTS
+    # (колонка user_id), а не фильтром после поиска по всем строкам.
+    # Существующие строки индексирует backfill_full_text_search пачками,
+    # новые — триггеры; граница между ними — until_id в fts_backfill
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fts_backfill (
+            fts TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            until_id INTEGER NOT NULL
+        )
+    ''')
+    for fts, table, columns in FTS_INDEXES:
+        for event in ('insert', 'delete', 'update'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{event}')
+        cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE {fts} USING fts5(
+                {', '.join(columns)}, content = '{table}',
+                content_rowid = 'id', {FTS_TOKENIZE}
+            )
+        ''')
+        # Совпадение по user_id не влияет на релевантность
+        weights = ', '.join(['0.0'] + ['1.0'] * (len(columns) - 1))
+        cursor.execute(
+            f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({weights})')"
+        )
+        _fts_triggers(cursor, table, fts, columns)
+        cursor.execute(
+            f'INSERT OR REPLACE INTO fts_backfill (fts, last_id, until_id) '
+            f'SELECT ?, 0, COALESCE(MAX(id), 0) FROM {table}',
+            (fts,)
+        )
+
+
+def _outbox_claims(cursor):
+    # Кто и когда захватил запись на отправку: процесс восстанавливает
+    # только свои и зависшие захваты, не трогая отправки других процессов
+    _add_missing_columns(
+        cursor, 'outbox', {'claimed_by': 'TEXT', 'claimed_at': 'REAL'}
+    )
+
+
+# Порядок и номера миграций не меняются: новые добавляются в конец
+MIGRATIONS = [
+    (1, _base_tables),
+    (2, _reminder_due_index),
+    (3, _outbox),
+    (4, _scheduler_leases),
+    (5, _user_lookup_indexes),
+    (6, _shopping_quantity),
+    (7, _shopping_page_index),
+    (8, _reminders_archive),
+    (9, _full_text_search),
+    (10, _user_states),
+    (11, _full_text_search_by_user),
+    (12, _outbox_claims),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Применение миграций новее PRAGMA user_version.
+
+    Версия перечитывается под блокировкой записи, поэтому несколько
+    процессов, стартующих одновременно, не применят миграцию дважды.
+    Возвращает итоговую версию схемы.
+    """
+    for number, migration in MIGRATIONS:
+        if number <= schema_version(conn):
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            if number > schema_version(conn):
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return schema_version(conn)
+
+
+def backfill_reminder_epochs(conn, batch_size):
+    """Перенос текстовых дат напоминаний в due_at и anchor_at.
+
+    Старые даты — наивное локальное время, в том числе с микросекундами.
+    Нераспознанные даты отключаются, чтобы не выбираться повторно.
+    """
+    total, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            'SELECT id, datetime FROM reminders '
+            'WHERE id > ? AND due_at IS NULL ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        converted, broken = [], []
+        for rem_id, dt_str in rows:
+            try:
+                due_at = int(datetime.fromisoformat(dt_str).timestamp())
+                converted.append((due_at, due_at, rem_id))
+            except Exception as e:
+                print(f"Ошибка обработки даты {rem_id}: {e}")
+                broken.append((rem_id,))
+        try:
+            conn.executemany(
+                'UPDATE reminders SET due_at = ?, '
+                'anchor_at = COALESCE(anchor_at, ?) WHERE id = ?',
+                converted
+            )
+            conn.executemany(
+                'UPDATE reminders SET due_at = 0, anchor_at = 0, is_active = 0 '
+                'WHERE id = ?',
+                broken
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+        last_id = rows[-1][0]
+
+
+def backfill_reminder_anchors(conn, batch_size):
+    """anchor_at для дат, перенесённых без него.
+
+    Без опорной даты ежемесячный повтор считается от уже сдвинутого
+    срока и уплывает (31.01 → 28.02 → 28.03).
+    """
+    total, last_id = 0, 0
+    while True:
+        rows = conn.execute(
+            'SELECT id FROM reminders WHERE id > ? AND anchor_at IS NULL '
+            'AND due_at IS NOT NULL ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        try:
+            conn.executemany(
+                'UPDATE reminders SET anchor_at = due_at WHERE id = ?', rows
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
+        last_id = rows[-1][0]
+
+
+def backfill_full_text_search(conn, batch_size):
+    """Индексация строк, созданных до миграции 11.
+
+    Пачка и отметка прогресса пишутся в одной транзакции, поэтому
+    несколько процессов не проиндексируют строку дважды.
+    """
+    total = 0
+    for fts, table, columns in FTS_INDEXES:
+        names = ', '.join(columns)
+        while True:
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                progress = conn.execute(
+                    'SELECT last_id, until_id FROM fts_backfill WHERE fts = ?',
+                    (fts,)
+                ).fetchone()
+                if progress is None or progress[0] >= progress[1]:
+                    conn.commit()
+                    break
+                last_id, until_id = progress
+                rows = conn.execute(
+                    f'SELECT id, {names} FROM {table} '
+                    f'WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+                    (last_id, until_id, batch_size)
+                ).fetchall()
+                conn.executemany(
+                    f'INSERT INTO {fts} (rowid, {names}) '
+                    f'VALUES ({", ".join("?" * (len(columns) + 1))})',
+                    rows
+                )
+                conn.execute(
+                    'UPDATE fts_backfill SET last_id = ? WHERE fts = ?',
+                    (rows[-1][0] if len(rows) == batch_size else until_id, fts)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            total += len(rows)
+    return total
+
+
+# Переносы данных: идемпотентны и возобновляемы, каждая пачка —
+# отдельная короткая транзакция
+BACKFILLS = [
+    backfill_reminder_epochs,
+    backfill_reminder_anchors,
+    backfill_full_text_search,
+]
+
+
+def run_backfills(conn, batch_size=1000):
+    """Выполнение всех переносов данных. Возвращает число строк"""
+    return sum(backfill(conn, batch_size) for backfill in BACKFILLS)
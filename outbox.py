@@ -0,0 +1,198 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from database import DB
+from metrics import DELIVERY_DELAY
+
+MAX_ATTEMPTS = 5
+BASE_BACKOFF = 5
+MAX_BACKOFF = 3600
+# Интервал проверки очереди, если нет известных сроков повтора
+IDLE_INTERVAL = 5
+# Сколько хранить отправленные записи, сек
+SENT_RETENTION = 24 * 3600
+# Захват старше этого считается брошенным упавшим процессом, сек
+CLAIM_TIMEOUT = 300
+
+
+def enqueue(cursor, idempotency_key, reminder_id, due_at, chat_id, text):
+    """Постановка уведомления в очередь в текущей транзакции.
+
+    Повторная постановка с тем же ключом игнорируется.
+    """
+    enqueue_many(
+        cursor, [(idempotency_key, reminder_id, due_at, chat_id, text)]
+    )
+
+
+def enqueue_many(cursor, messages):
+    """Пакетная постановка [(ключ, reminder_id, due_at, chat_id, текст), ...]"""
+    now = time.time()
+    cursor.executemany(
+        'INSERT OR IGNORE INTO outbox '
+        '(idempotency_key, reminder_id, due_at, chat_id, text, '
+        'next_attempt_at, created) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [message + (now, now) for message in messages]
+    )
+
+
+def backoff(attempts):
+    """Задержка перед следующей попыткой, сек"""
+    return min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempts - 1))
+
+
+class OutboxSender:
+    """Фоновая отправка уведомлений из таблицы outbox.
+
+    Каждый поток отправки захватывает одну запись (status = 'sending',
+    claimed_by, claimed_at) и фиксирует захват до отправки, а результат
+    записывает сразу после неё. Сбой между отправкой и записью
+    результата не приводит к повторной отправке: такие записи уходят в
+    dead-letter (recover). Неудачные отправки повторяются с
+    экспоненциальной задержкой, после MAX_ATTEMPTS запись помечается
+    как dead.
+    """
+
+    def __init__(self, dispatcher, owner=None):
+        self.dispatcher = dispatcher
+        self.owner = owner or (
+            f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        )
+        self._wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def notify(self):
+        """Разбудить отправителя: в очереди появились записи"""
+        self._wakeup.set()
+
+    def recover(self, now=None):
+        """Прерванные отправки — в dead-letter.
+
+        Свои захваты снимаются между drain, когда своих отправок нет;
+        чужие — только старше CLAIM_TIMEOUT: их процесс, видимо, упал.
+        """
+        now = time.time() if now is None else now
+        with DB() as cursor:
+            cursor.execute(
+                "UPDATE outbox SET status = 'dead', "
+                "last_error = 'interrupted during send' "
+                "WHERE status = 'sending' AND (claimed_by IS ? "
+                "OR claimed_at IS NULL OR claimed_at < ?)",
+                (self.owner, now - CLAIM_TIMEOUT)
+            )
+
+    def claim(self, now):
+        """Захват одной записи; несколько процессов не захватят одну запись"""
+        with DB() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(
+                "SELECT id, chat_id, text, attempts, due_at FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (now,)
+            )
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(
+                    "UPDATE outbox SET status = 'sending', claimed_by = ?, "
+                    "claimed_at = ? WHERE id = ?",
+                    (self.owner, time.time(), row[0])
+                )
+        return row
+
+    def deliver(self, row, now):
+        """Отправка захваченной записи и запись её результата"""
+        row_id, chat_id, text, attempts, due_at = row
+        error = self.dispatcher.send(chat_id, text)
+        attempts += 1
+        # Запись, которую recover уже счёл брошенной, не меняется
+        claimed = " WHERE id = ? AND status = 'sending' AND claimed_by = ?"
+        with DB() as cursor:
+            if error is None:
+                cursor.execute(
+                    "UPDATE outbox SET status = 'sent', attempts = ?"
+                    + claimed,
+                    (attempts, row_id, self.owner)
+                )
+            elif attempts >= MAX_ATTEMPTS:
+                cursor.execute(
+                    "UPDATE outbox SET status = 'dead', attempts = ?, "
+                    "last_error = ?" + claimed,
+                    (attempts, str(error), row_id, self.owner)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE outbox SET status = 'pending', attempts = ?, "
+                    "next_attempt_at = ?, last_error = ?" + claimed,
+                    (attempts, now + backoff(attempts), str(error), row_id,
+                     self.owner)
+                )
+        if error is None and due_at is not None:
+            DELIVERY_DELAY.observe(time.time() - due_at)
+
+    def drain(self):
+        """Отправить все записи, срок которых наступил. Возвращает их число"""
+        now = time.time()
+
+        def worker():
+            count = 0
+            while True:
+                row = self.claim(now)
+                if row is None:
+                    return count
+                self.deliver(row, now)
+                count += 1
+
+        return sum(self.dispatcher.run_workers(worker))
+
+    def pending_count(self):
+        with DB() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+            )
+            return cursor.fetchone()[0]
+
+    def next_attempt_in(self):
+        """Через сколько секунд наступит ближайшая попытка"""
+        with DB() as cursor:
+            cursor.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox "
+                "WHERE status = 'pending'"
+            )
+            next_at = cursor.fetchone()[0]
+        if next_at is None:
+            return IDLE_INTERVAL
+        return min(IDLE_INTERVAL, max(0, next_at - time.time()))
+
+    def purge(self):
+        """Удаление давно отправленных записей"""
+        with DB() as cursor:
+            cursor.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND created < ?",
+                (time.time() - SENT_RETENTION,)
+            )
+
+    def stop(self):
+        self.stopped.set()
+        self._wakeup.set()
+
+    def run(self):
+        purged_at = recovered_at = 0
+        while not self.stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if time.time() - recovered_at > CLAIM_TIMEOUT / 10:
+                    self.recover()
+                    recovered_at = time.time()
+                self.drain()
+                if time.time() - purged_at > SENT_RETENTION / 24:
+                    self.purge()
+                    purged_at = time.time()
+                timeout = self.next_attempt_in()
+            except Exception as e:
+                print(f"Ошибка в OutboxSender: {e}")
+                timeout = IDLE_INTERVAL
+            self._wakeup.wait(timeout)
@@ -0,0 +1,56 @@
+"""Постраничный просмотр списков с переходом по ключу id.
+
+Страница запрашивается из хранилища с запасом в одну строку — так
+известно, есть ли следующая, без подсчёта всего списка.
+"""
+
+PAGE_SIZE = 10
+# Длинные тексты в списках обрезаются, чтобы одна строка не занимала
+# всё сообщение
+ROW_TEXT_LIMIT = 300
+# Лимит Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+
+class Page:
+
+    def __init__(self, rows, has_prev, has_next):
+        self.rows = rows
+        self.has_prev = has_prev
+        self.has_next = has_next
+
+
+def load_page(fetch, user_id, after=None, before=None, size=PAGE_SIZE):
+    """Страница fetch(user_id, after, before, limit) после after или перед before.
+
+    Если страница опустела (строки удалили), возвращается первая.
+    """
+    rows = fetch(user_id, after=after, before=before, limit=size + 1)
+    if before is not None:
+        page = Page(rows[-size:], len(rows) > size, True)
+    else:
+        page = Page(rows[:size], bool(after), len(rows) > size)
+    if not page.rows and (after or before is not None):
+        return load_page(fetch, user_id, size=size)
+    return page
+
+
+def clip(text, limit=ROW_TEXT_LIMIT):
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def fit_page(page, render, backward=False, limit=MESSAGE_LIMIT):
+    """(страница, текст, клавиатура) из render(page), не длиннее limit.
+
+    Строки, не уместившиеся в сообщение, отбрасываются с конца, а при
+    листании назад — с начала страницы; до них можно будет долистать.
+    Длина считается по тексту с разметкой, то есть с запасом.
+    """
+    while True:
+        text, markup = render(page)
+        if len(text) <= limit or len(page.rows) == 1:
+            return page, text, markup
+        if backward:
+            page = Page(page.rows[1:], True, page.has_next)
+        else:
+            page = Page(page.rows[:-1], page.has_prev, True)
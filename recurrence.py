@@ -0,0 +1,75 @@
+from datetime import datetime
+from functools import lru_cache
+from dateutil.relativedelta import relativedelta  # type: ignore
+from dateutil.rrule import rrulestr  # type: ignore
+
+# Шаг и его средняя длина в секундах — для оценки числа пропущенных периодов
+PERIODS = {
+    'daily': (relativedelta(days=1), 86400),
+    'weekly': (relativedelta(weeks=1), 7 * 86400),
+    'monthly': (relativedelta(months=1), 2629746),
+    'yearly': (relativedelta(years=1), 31556952),
+}
+RULE_CACHE_SIZE = 10000
+
+
+def is_custom_rule(repeat):
+    """Произвольное правило в формате RFC 5545, например FREQ=WEEKLY;BYDAY=MO,FR"""
+    return repeat.upper().startswith(('RRULE:', 'FREQ='))
+
+
+@lru_cache(maxsize=RULE_CACHE_SIZE)
+def compile_rule(repeat, anchor_at):
+    """Скомпилированное правило повтора для напоминания.
+
+    Ключ кэша — правило и исходный срок напоминания, то есть фактически
+    отдельное напоминание. Для произвольных правил возвращается rrule.
+    """
+    if is_custom_rule(repeat):
+        return rrulestr(repeat, dtstart=datetime.fromtimestamp(anchor_at),
+                        cache=True)
+    if repeat not in PERIODS:
+        raise ValueError(f'Неизвестная периодичность: {repeat}')
+    return PERIODS[repeat]
+
+
+def _advance(anchor, step, approx, after):
+    """Первый срок anchor + step * k строго позже after, k >= 1.
+
+    Число шагов оценивается делением, затем уточняется на единицы,
+    поэтому стоимость не зависит от длины простоя.
+    """
+    k = max(1, int((after - anchor).total_seconds() // approx))
+    while k > 1 and anchor + step * (k - 1) > after:
+        k -= 1
+    while anchor + step * k <= after:
+        k += 1
+    return anchor + step * k
+
+
+def next_occurrence(repeat, anchor_at, due_at, now):
+    """Следующее срабатывание строго позже now и текущего срока.
+
+    Сроки — секунды UTC epoch. Календарная арифметика ведётся в
+    локальном времени от исходного срока anchor_at: «ежемесячно 31-го»
+    в коротких месяцах срабатывает в последний день месяца и не
+    сползает. Возвращает None, если повторов больше нет или правило
+    не распознано.
+    """
+    after = datetime.fromtimestamp(max(now, due_at))
+    try:
+        rule = compile_rule(repeat, anchor_at)
+    except ValueError as e:
+        print(f"Ошибка правила повтора: {e}")
+        return None
+
+    if isinstance(rule, tuple):
+        step, approx = rule
+        next_dt = _advance(
+            datetime.fromtimestamp(anchor_at), step, approx, after
+        )
+    else:
+        next_dt = rule.after(after)
+        if next_dt is None:
+            return None
+    return int(next_dt.timestamp())
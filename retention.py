@@ -0,0 +1,119 @@
+"""Перенос отработавших напоминаний в архив и возврат места на диске.
+
+Неактивные напоминания со сроком старше RETENTION_DAYS переносятся из
+reminders в reminders_archive пачками по BATCH_SIZE, каждая пачка —
+отдельная короткая транзакция. После переноса освободившиеся страницы
+возвращаются PRAGMA incremental_vacuum. Он работает только в базе
+с auto_vacuum = INCREMENTAL: новые базы создаются так сразу, старую
+нужно один раз перестроить командой python retention.py --vacuum.
+"""
+import os
+import sys
+import time
+
+from database import DB, get_connection
+from metrics import ARCHIVED_REMINDERS, RECLAIMED_BYTES
+
+RETENTION_DAYS = 30
+BATCH_SIZE = 500
+# Как часто запускать перенос, сек
+RETENTION_INTERVAL = 3600
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def archive_batch(cutoff, batch_size=BATCH_SIZE, now=None):
+    """Перенос одной пачки, возвращает число перенесённых напоминаний"""
+    with DB() as cursor:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(
+            'SELECT id FROM reminders WHERE is_active = 0 AND due_at < ? '
+            'LIMIT ?',
+            (cutoff, batch_size)
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ', '.join('?' * len(ids))
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO reminders_archive
+                (id, user_id, text, due_at, repeat, anchor_at, archived_at)
+            SELECT id, user_id, text, due_at, repeat, anchor_at, ?
+            FROM reminders WHERE id IN ({placeholders})
+        ''', [int(now or time.time()), *ids])
+        cursor.execute(
+            f'DELETE FROM reminders WHERE id IN ({placeholders})', ids
+        )
+    return len(ids)
+
+
+def database_size(conn):
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    return page_count * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+def reclaim_space():
+    """incremental_vacuum, возвращает освобождённые байты"""
+    conn = get_connection()
+    mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode != AUTO_VACUUM_INCREMENTAL:
+        return 0
+    before = database_size(conn)
+    # Каждый шаг прагмы освобождает одну страницу — выбираем до конца
+    conn.execute('PRAGMA incremental_vacuum').fetchall()
+    conn.commit()
+    return before - database_size(conn)
+
+
+def run_retention(days=None, batch_size=BATCH_SIZE):
+    """Один проход: (перенесено напоминаний, освобождено байт)"""
+    days = days if days is not None else int(
+        os.getenv('RETENTION_DAYS', RETENTION_DAYS)
+    )
+    cutoff = int(time.time()) - days * 86400
+    archived = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+    reclaimed = reclaim_space()
+    ARCHIVED_REMINDERS.inc(archived)
+    RECLAIMED_BYTES.inc(reclaimed)
+    if archived or reclaimed:
+        print(
+            f"Архив напоминаний: перенесено {archived}, "
+            f"освобождено {reclaimed // 1024} КБ"
+        )
+    return archived, reclaimed
+
+
+def retention_loop(interval=RETENTION_INTERVAL):
+    """Фоновый перенос раз в interval секунд"""
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"Ошибка переноса в архив: {e}")
+        time.sleep(interval)
+
+
+def enable_incremental_vacuum():
+    """Однократная перестройка старой базы под incremental_vacuum.
+
+    VACUUM переписывает файл целиком и блокирует запись, поэтому
+    запускается вручную при остановленном боте.
+    """
+    conn = get_connection()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv  # type: ignore
+    from storage import SQLiteStorage
+
+    load_dotenv()
+    SQLiteStorage()
+    if '--vacuum' in sys.argv:
+        enable_incremental_vacuum()
+    run_retention()
@@ -0,0 +1,105 @@
+"""Маршрутизация обновлений бота по таблицам вместо цепочки фильтров.
+
+Обработчик сообщения выбирается словарными поисками в порядке:
+команда, точный текст (кнопки меню), шаг диалога. Состояние диалога
+читается один раз на сообщение. Callback-запросы ищутся по точному
+callback_data, затем по префиксам. Время обработки каждого обновления
+попадает в гистограмму DISPATCH_DURATION.
+"""
+import time
+
+from telebot import util  # type: ignore
+
+from metrics import DISPATCH_DURATION
+
+
+class Router:
+
+    def __init__(self, states):
+        self.states = states
+        self.commands = {}
+        self.texts = {}
+        self.steps = {}
+        self.callbacks = {}
+        self.callback_prefixes = []
+
+    def command(self, name):
+        """Обработчик команды /name"""
+        def decorator(handler):
+            self.commands[name] = handler
+            return handler
+        return decorator
+
+    def text(self, value):
+        """Обработчик сообщения с точно таким текстом"""
+        def decorator(handler):
+            self.texts[value] = handler
+            return handler
+        return decorator
+
+    def step(self, name, content_types=('text',)):
+        """Обработчик сообщения на шаге диалога name"""
+        def decorator(handler):
+            self.steps[name] = (handler, frozenset(content_types))
+            return handler
+        return decorator
+
+    def callback(self, data):
+        def decorator(handler):
+            self.callbacks[data] = handler
+            return handler
+        return decorator
+
+    def callback_prefix(self, prefix):
+        """Обработчик callback_data, начинающихся с prefix"""
+        def decorator(handler):
+            self.callback_prefixes.append((prefix, handler))
+            return handler
+        return decorator
+
+    def resolve_message(self, message):
+        text = message.text
+        if text is not None:
+            command = util.extract_command(text)
+            if command in self.commands:
+                return self.commands[command]
+            if text in self.texts:
+                return self.texts[text]
+        route = self.steps.get(self.states.step(message.from_user.id))
+        if route is not None and message.content_type in route[1]:
+            return route[0]
+        return None
+
+    def resolve_callback(self, call):
+        data = call.data or ''
+        handler = self.callbacks.get(data)
+        if handler is not None:
+            return handler
+        for prefix, handler in self.callback_prefixes:
+            if data.startswith(prefix):
+                return handler
+        return None
+
+    def _dispatch(self, resolve, update):
+        started = time.perf_counter()
+        try:
+            handler = resolve(update)
+            if handler is not None:
+                handler(update)
+        finally:
+            DISPATCH_DURATION.observe(time.perf_counter() - started)
+
+    def dispatch_message(self, message):
+        self._dispatch(self.resolve_message, message)
+
+    def dispatch_callback(self, call):
+        self._dispatch(self.resolve_callback, call)
+
+    def install(self, bot, content_types=('text', 'document')):
+        """Подключение к TeleBot единственными обработчиками сообщений и callback"""
+        bot.register_message_handler(
+            self.dispatch_message, content_types=list(content_types)
+        )
+        bot.register_callback_query_handler(
+            self.dispatch_callback, func=lambda call: True
+        )
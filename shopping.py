@@ -0,0 +1,21 @@
+"""Разбор сообщения со списком покупок."""
+
+
+def parse_items(text):
+    """Пары (товар, категория или None) из сообщения.
+
+    Товары разделяются переводами строк и запятыми. Префикс
+    «категория:» относится к товарам своей строки:
+    «Молочное: молоко, кефир». Маркеры списка «-», «•», «*» отбрасываются.
+    """
+    items = []
+    for line in text.splitlines():
+        category = None
+        prefix, colon, rest = line.partition(':')
+        if colon and prefix.strip() and rest.strip():
+            category, line = prefix.strip(), rest
+        for item in line.split(','):
+            item = item.strip().lstrip('-•*').strip()
+            if item:
+                items.append((item, category))
+    return items
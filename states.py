@@ -0,0 +1,141 @@
+"""Хранилища состояния диалогов пользователей.
+
+Состояние — словарь шага диалога ({"step": ..., ...}), который
+обработчики bot.py передают от сообщения к сообщению. Брошенный
+диалог удаляется через STATE_TTL секунд после последнего изменения.
+memory — в памяти процесса, с ограничением числа записей (LRU);
+sqlite — в таблице user_states, переживает перезапуск и общее для
+нескольких процессов бота.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import DB
+
+STATE_TTL = 3600
+MAX_STATES = 100000
+# Как часто удалять просроченные записи из user_states, сек
+PURGE_INTERVAL = 600
+
+
+class StateStore:
+
+    def get(self, user_id):
+        """Состояние пользователя или None"""
+        raise NotImplementedError
+
+    def set(self, user_id, state):
+        raise NotImplementedError
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def step(self, user_id):
+        """Текущий шаг диалога или None"""
+        state = self.get(user_id)
+        return state.get('step') if state else None
+
+
+class MemoryStateStore(StateStore):
+
+    def __init__(self, ttl=None, maxsize=None):
+        self.ttl = ttl or float(os.getenv('STATE_TTL', STATE_TTL))
+        self.maxsize = maxsize or int(os.getenv('MAX_STATES', MAX_STATES))
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._states.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._states[user_id]
+                return None
+            self._states.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._states[user_id] = (time.monotonic() + self.ttl, state)
+            self._states.move_to_end(user_id)
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._states)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(f'Не сериализуется: {type(value).__name__}')
+
+
+def _decode(value):
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    return value
+
+
+class SQLiteStateStore(StateStore):
+    """Состояния в таблице user_states в виде JSON"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or float(os.getenv('STATE_TTL', STATE_TTL))
+        self._purged_at = 0
+
+    def get(self, user_id):
+        with DB() as cursor:
+            cursor.execute(
+                'SELECT state FROM user_states '
+                'WHERE user_id = ? AND expires_at > ?',
+                (user_id, time.time())
+            )
+            row = cursor.fetchone()
+        return json.loads(row[0], object_hook=_decode) if row else None
+
+    def set(self, user_id, state):
+        now = time.time()
+        with DB() as cursor:
+            cursor.execute(
+                'INSERT OR REPLACE INTO user_states '
+                '(user_id, state, expires_at) VALUES (?, ?, ?)',
+                (user_id, json.dumps(state, default=_encode), now + self.ttl)
+            )
+            if now - self._purged_at > PURGE_INTERVAL:
+                cursor.execute(
+                    'DELETE FROM user_states WHERE expires_at <= ?', (now,)
+                )
+                self._purged_at = now
+
+    def delete(self, user_id):
+        with DB() as cursor:
+            cursor.execute(
+                'DELETE FROM user_states WHERE user_id = ?', (user_id,)
+            )
+
+
+BACKENDS = {
+    'sqlite': SQLiteStateStore,
+    'memory': MemoryStateStore,
+}
+
+
+def create_state_store(backend=None, **options):
+    """Хранилище состояний: STATE_BACKEND, по умолчанию как STORAGE_BACKEND"""
+    backend = (
+        backend or os.getenv('STATE_BACKEND')
+        or os.getenv('STORAGE_BACKEND', 'sqlite')
+    )
+    if backend not in BACKENDS:
+        raise ValueError(f'Неизвестное хранилище состояний: {backend}')
+    return BACKENDS[backend](**options)
@@ -0,0 +1,290 @@
+"""Хранилища данных бота: пользователи, напоминания, список покупок.
+
+Обработчики bot.py работают только с интерфейсом Storage. Бэкенд
+выбирается переменной окружения STORAGE_BACKEND (см. BACKENDS):
+sqlite — рабочий вариант на database.py, memory — словари в памяти
+процесса для тестов и бенчмарков. Планировщик и outbox читают
+напоминания из SQLite напрямую, поэтому с memory напоминания не
+отправляются.
+"""
+import itertools
+import os
+import re
+import threading
+from datetime import datetime
+
+import database
+
+
+class Storage:
+    """Интерфейс хранилища.
+
+    Напоминания возвращаются кортежами (id, текст, datetime, повтор),
+    товары — (id, название, категория, количество), как в database.py.
+    Повторное добавление товара с той же категорией увеличивает
+    количество.
+    """
+
+    def add_user(self, user_id):
+        """Регистрация пользователя, повторная — без изменений"""
+        raise NotImplementedError
+
+    def add_reminder(self, user_id, text, dt, repeat=None):
+        """Добавление напоминания, возвращает его id"""
+        raise NotImplementedError
+
+    def add_reminders(self, user_id, rows):
+        """Добавление пачки напоминаний [(текст, datetime, повтор)]"""
+        raise NotImplementedError
+
+    def get_reminders(self, user_id):
+        raise NotImplementedError
+
+    def iter_reminders(self, user_id):
+        """Напоминания по порядку id без загрузки всех в память"""
+        raise NotImplementedError
+
+    def iter_archived_reminders(self, user_id):
+        """Отработавшие напоминания, перенесённые в архив"""
+        raise NotImplementedError
+
+    def page_reminders(self, user_id, after=None, before=None, limit=10):
+        """До limit напоминаний по возрастанию id: после id after
+        или, если задан before, непосредственно перед ним"""
+        raise NotImplementedError
+
+    def search(self, user_id, text, limit=10):
+        """(напоминания, товары), в которых есть все слова запроса"""
+        raise NotImplementedError
+
+    def delete_reminder(self, rem_id):
+        raise NotImplementedError
+
+    def get_shopping_list(self, user_id):
+        raise NotImplementedError
+
+    def iter_shopping_list(self, user_id):
+        """Товары по порядку id без загрузки всех в память"""
+        raise NotImplementedError
+
+    def page_shopping_list(self, user_id, after=None, before=None, limit=10):
+        """Страница товаров, как page_reminders"""
+        raise NotImplementedError
+
+    def add_shopping_item(self, user_id, item, category, quantity=1):
+        raise NotImplementedError
+
+    def add_shopping_items(self, user_id, rows):
+        """Добавление товаров [(название, категория, количество)] разом"""
+        raise NotImplementedError
+
+    def delete_shopping_item(self, item_id):
+        raise NotImplementedError
+
+    def delete_all_shopping_items(self, user_id):
+        raise NotImplementedError
+
+
+class SQLiteStorage(Storage):
+    """Хранилище в SQLite через функции database.py.
+
+    Путь к базе — аргумент path или переменная окружения DB_PATH.
+    Соединения и кэши в database.py общие на процесс, поэтому процесс
+    работает с одной базой.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('DB_PATH') or database.DB_PATH
+        if self.path != database.DB_PATH:
+            database.DB_PATH = self.path
+            database.reminders_cache.clear()
+            database.shopping_cache.clear()
+        database.init_db()
+
+    def add_user(self, user_id):
+        with database.DB() as cursor:
+            cursor.execute(
+                'INSERT OR IGNORE INTO users (user_id, created) VALUES (?, ?)',
+                (user_id, datetime.now())
+            )
+
+    def add_reminder(self, user_id, text, dt, repeat=None):
+        return database.add_reminder(user_id, text, dt, repeat)
+
+    def add_reminders(self, user_id, rows):
+        database.add_reminders(user_id, rows)
+
+    def get_reminders(self, user_id):
+        return database.get_reminders(user_id)
+
+    def iter_reminders(self, user_id):
+        return database.iter_reminders(user_id)
+
+    def iter_archived_reminders(self, user_id):
+        return database.iter_archived_reminders(user_id)
+
+    def page_reminders(self, user_id, after=None, before=None, limit=10):
+        return database.page_reminders(user_id, after, before, limit)
+
+    def search(self, user_id, text, limit=10):
+        return database.search(user_id, text, limit)
+
+    def delete_reminder(self, rem_id):
+        database.delete_reminder(rem_id)
+
+    def get_shopping_list(self, user_id):
+        return database.get_shopping_list(user_id)
+
+    def iter_shopping_list(self, user_id):
+        return database.iter_shopping_list(user_id)
+
+    def page_shopping_list(self, user_id, after=None, before=None, limit=10):
+        return database.page_shopping_list(user_id, after, before, limit)
+
+    def add_shopping_item(self, user_id, item, category, quantity=1):
+        database.add_shopping_item(user_id, item, category, quantity)
+
+    def add_shopping_items(self, user_id, rows):
+        database.add_shopping_items(user_id, rows)
+
+    def delete_shopping_item(self, item_id):
+        database.delete_shopping_item(item_id)
+
+    def delete_all_shopping_items(self, user_id):
+        database.delete_all_shopping_items(user_id)
+
+
+class MemoryStorage(Storage):
+    """Хранилище в памяти процесса: словари по id и по пользователю"""
+
+    def __init__(self):
+        self.users = {}
+        self.reminders = {}
+        self.shopping = {}
+        self._user_reminders = {}
+        self._user_shopping = {}
+        self._shopping_keys = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_user(self, user_id):
+        with self._lock:
+            self.users.setdefault(user_id, datetime.now())
+
+    def add_reminder(self, user_id, text, dt, repeat=None):
+        with self._lock:
+            rem_id = next(self._ids)
+            self.reminders[rem_id] = (user_id, text, dt, repeat)
+            self._user_reminders.setdefault(user_id, {})[rem_id] = None
+        return rem_id
+
+    def add_reminders(self, user_id, rows):
+        for text, dt, repeat in rows:
+            self.add_reminder(user_id, text, dt, repeat)
+
+    def get_reminders(self, user_id):
+        with self._lock:
+            return [
+                (rem_id, *self.reminders[rem_id][1:])
+                for rem_id in self._user_reminders.get(user_id, ())
+            ]
+
+    def iter_reminders(self, user_id):
+        return iter(self.get_reminders(user_id))
+
+    def iter_archived_reminders(self, user_id):
+        # Архива в памяти нет: напоминания здесь не срабатывают
+        return iter(())
+
+    def page_reminders(self, user_id, after=None, before=None, limit=10):
+        return _page(self.get_reminders(user_id), after, before, limit)
+
+    def search(self, user_id, text, limit=10):
+        # Без ранжирования: слова запроса ищутся как начала слов текста
+        words = [word.lower() for word in re.findall(r'\w+', text)]
+        if not words:
+            return [], []
+
+        def matches(*fields):
+            tokens = re.findall(r'\w+', ' '.join(fields).lower())
+            return all(
+                any(token.startswith(word) for token in tokens)
+                for word in words
+            )
+
+        reminders = [
+            rem for rem in self.get_reminders(user_id) if matches(rem[1])
+        ]
+        items = [
+            item for item in self.get_shopping_list(user_id)
+            if matches(item[1], item[2] or '')
+        ]
+        return reminders[:limit], items[:limit]
+
+    def delete_reminder(self, rem_id):
+        with self._lock:
+            reminder = self.reminders.pop(int(rem_id), None)
+            if reminder is not None:
+                self._user_reminders[reminder[0]].pop(int(rem_id))
+
+    def get_shopping_list(self, user_id):
+        with self._lock:
+            return [
+                (item_id, *self.shopping[item_id][1:])
+                for item_id in self._user_shopping.get(user_id, ())
+            ]
+
+    def iter_shopping_list(self, user_id):
+        return iter(self.get_shopping_list(user_id))
+
+    def page_shopping_list(self, user_id, after=None, before=None, limit=10):
+        return _page(self.get_shopping_list(user_id), after, before, limit)
+
+    def add_shopping_item(self, user_id, item, category, quantity=1):
+        self.add_shopping_items(user_id, [(item, category, quantity)])
+
+    def add_shopping_items(self, user_id, rows):
+        with self._lock:
+            for item, category, quantity in rows:
+                key = (user_id, item, category)
+                item_id = self._shopping_keys.get(key)
+                if item_id is not None:
+                    quantity += self.shopping[item_id][3]
+                else:
+                    item_id = self._shopping_keys[key] = next(self._ids)
+                    self._user_shopping.setdefault(user_id, {})[item_id] = None
+                self.shopping[item_id] = (user_id, item, category, quantity)
+
+    def delete_shopping_item(self, item_id):
+        with self._lock:
+            item = self.shopping.pop(int(item_id), None)
+            if item is not None:
+                self._user_shopping[item[0]].pop(int(item_id))
+                del self._shopping_keys[item[:3]]
+
+    def delete_all_shopping_items(self, user_id):
+        with self._lock:
+            for item_id in self._user_shopping.pop(user_id, {}):
+                del self._shopping_keys[self.shopping.pop(item_id)[:3]]
+
+
+def _page(rows, after, before, limit):
+    """Страница из строк, упорядоченных по id"""
+    if before is not None:
+        return [row for row in rows if row[0] < before][-limit:]
+    return [row for row in rows if row[0] > (after or 0)][:limit]
+
+
+# Новые бэкенды регистрируются здесь
+BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'memory': MemoryStorage,
+}
+
+
+def create_storage(backend=None, **options):
+    """Хранилище по имени бэкенда (по умолчанию STORAGE_BACKEND или sqlite)"""
+    backend = backend or os.getenv('STORAGE_BACKEND', 'sqlite')
+    if backend not in BACKENDS:
+        raise ValueError(f'Неизвестное хранилище: {backend}')
+    return BACKENDS[backend](**options)
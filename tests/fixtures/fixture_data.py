@@ -46,3 +46,23 @@ def data_with_new_hw_status(random_timestamp):
         ],
         'current_date': random_timestamp
     }
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    import database
+    path = str(tmp_path / 'assistant.db')
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    database.reminders_cache.clear()
+    database.shopping_cache.clear()
+    database.init_db()
+    yield path
+    database.close_connections()
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def storage(request):
+    from storage import MemoryStorage, SQLiteStorage
+    if request.param == 'memory':
+        return MemoryStorage()
+    return SQLiteStorage(request.getfixturevalue('db_path'))
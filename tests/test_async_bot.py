@@ -0,0 +1,168 @@
+import io
+import asyncio
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import database
+from async_bot import AsyncReminderScheduler, BufferedBot, UserLocks, install
+from routing import Router
+from states import MemoryStateStore
+from tests.test_reminders import RecordingBot
+
+
+class FakeAsyncBot:
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text, threading.current_thread().name))
+        return text
+
+    async def send_document(self, chat_id, document, visible_file_name=None):
+        self.sent.append((chat_id, document, document.closed))
+
+    def register_message_handler(self, handler, **kwargs):
+        self.on_message = handler
+
+    def register_callback_query_handler(self, handler, **kwargs):
+        self.on_callback = handler
+
+
+def message(user_id, text):
+    return SimpleNamespace(
+        text=text, content_type='text',
+        from_user=SimpleNamespace(id=user_id),
+    )
+
+
+class TestAsyncBot:
+
+    def test_handlers_run_in_db_executor_in_user_order(self):
+        router = Router(MemoryStateStore())
+        handled = []
+        async_bot = FakeAsyncBot()
+
+        async def receive():
+            buffered = BufferedBot(async_bot, asyncio.get_running_loop())
+
+            @router.step('item')
+            def item(message):
+                if message.from_user.id == 1:
+                    time.sleep(0.01)
+                handled.append((
+                    message.from_user.id, message.text,
+                    threading.current_thread().name.startswith('db'),
+                ))
+                buffered.send_message(message.from_user.id, message.text)
+
+            locks = install(router, async_bot, buffered)
+            await asyncio.gather(*(
+                async_bot.on_message(message(user_id, str(n)))
+                for n in range(5) for user_id in (1, 2)
+            ))
+            return locks
+
+        router.states.set(1, {'step': 'item'})
+        router.states.set(2, {'step': 'item'})
+        locks = asyncio.run(receive())
+        assert all(in_executor for _, _, in_executor in handled), (
+            'Обработчики должны выполняться в DB_EXECUTOR'
+        )
+        assert [text for user_id, text, _ in handled if user_id == 1] == [
+            '0', '1', '2', '3', '4'
+        ], 'Сообщения одного пользователя обрабатываются по порядку'
+        assert [text for chat_id, text, _ in async_bot.sent if chat_id == 1] == [
+            '0', '1', '2', '3', '4'
+        ], 'Ответы одного пользователя отправляются по порядку'
+        assert all(
+            thread == threading.main_thread().name
+            for _, _, thread in async_bot.sent
+        ), 'Ответы должны отправляться корутинами цикла, а не из DB_EXECUTOR'
+        assert len(locks) == 0, 'Блокировки без ожидающих удаляются'
+
+    def test_export_file_is_sent_open_and_closed_after(self):
+        router = Router(MemoryStateStore())
+        async_bot = FakeAsyncBot()
+        document = io.BytesIO(b'id,text')
+
+        async def receive():
+            buffered = BufferedBot(async_bot, asyncio.get_running_loop())
+
+            @router.command('export')
+            def export(message):
+                buffered.send_document(1, document, visible_file_name='a.csv')
+                buffered.after_replies(document.close)
+
+            install(router, async_bot, buffered)
+            await async_bot.on_message(message(1, '/export'))
+
+        asyncio.run(receive())
+        assert async_bot.sent == [(1, document, False)], (
+            'Файл выгрузки должен отправляться из цикла открытым, без '
+            'чтения в память'
+        )
+        assert document.closed, 'Файл закрывается после отправки ответов'
+
+    def test_calls_outside_handlers_run_in_loop(self):
+        async_bot = FakeAsyncBot()
+
+        async def scenario():
+            buffered = BufferedBot(async_bot, asyncio.get_running_loop())
+            return await asyncio.to_thread(buffered.send_message, 1, 'отчёт')
+
+        assert asyncio.run(scenario()) == 'отчёт', (
+            'Вызов из фонового потока должен вернуть результат корутины'
+        )
+        assert async_bot.sent == [(1, 'отчёт', threading.main_thread().name)]
+
+    def test_user_locks_do_not_block_other_users(self):
+        locks = UserLocks()
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def slow():
+                async with locks.hold(1):
+                    await release.wait()
+
+            task = asyncio.create_task(slow())
+            await asyncio.sleep(0)
+            async with locks.hold(2):
+                release.set()
+            await task
+
+        asyncio.run(asyncio.wait_for(scenario(), 1))
+
+    def test_scheduler_task_fires_reminder(self, db_path, monkeypatch):
+        monkeypatch.setattr(database, '_reminder_listeners', [])
+        bot = RecordingBot()
+
+        async def scenario():
+            scheduler = AsyncReminderScheduler(
+                bot, asyncio.get_running_loop()
+            )
+            sender = threading.Thread(
+                target=scheduler.sender.run, daemon=True
+            )
+            sender.start()
+            task = asyncio.create_task(scheduler.run_async())
+            await asyncio.sleep(0.05)
+            # Срок уже наступил: задача должна проснуться от добавления
+            added_at = time.time()
+            await asyncio.to_thread(
+                database.add_reminder, 1, 'text',
+                datetime.fromtimestamp(int(added_at))
+            )
+            sent = await asyncio.to_thread(bot.sent.wait, 1)
+            scheduler.stop()
+            await asyncio.wait_for(task, 1)
+            await asyncio.to_thread(sender.join, 1)
+            assert not sender.is_alive()
+            return sent, added_at
+
+        sent, added_at = asyncio.run(scenario())
+        assert sent, 'Напоминание должно отправиться из задачи asyncio'
+        assert 0 <= bot.sent_at - added_at < 0.5
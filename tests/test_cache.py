@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import database
+from database import DB, UserCache
+from utils import enqueue_reminders, fetch_reminders, now_epoch
+
+
+class TestUserCache:
+
+    def test_repeated_reads_hit_cache(self, db_path):
+        database.add_shopping_item(1, 'молоко', 'продукты')
+        first = database.get_shopping_list(1)
+        with DB() as cursor:
+            cursor.execute('DELETE FROM shopping_list')
+        assert database.get_shopping_list(1) == first, (
+            'Повторное чтение списка должно обслуживаться из кэша'
+        )
+
+    def test_writes_invalidate_owner(self, db_path):
+        database.add_shopping_item(1, 'молоко', 'продукты')
+        database.add_shopping_item(2, 'хлеб', 'продукты')
+        item_id = database.get_shopping_list(1)[0][0]
+        database.get_shopping_list(2)
+        database.delete_shopping_item(item_id)
+        assert database.get_shopping_list(1) == [], (
+            'Удаление товара должно сбрасывать кэш владельца'
+        )
+        assert len(database.get_shopping_list(2)) == 1
+
+        rem_id = database.add_reminder(
+            1, 'позвонить', datetime.now() + timedelta(hours=1)
+        )
+        assert [row[0] for row in database.get_reminders(1)] == [rem_id], (
+            'Новое напоминание должно быть видно сразу после добавления'
+        )
+        database.delete_reminder(rem_id)
+        assert database.get_reminders(1) == []
+
+    def test_fired_reminder_leaves_cached_list(self, db_path):
+        rem_id = database.add_reminder(
+            1, 'позвонить', datetime.now() - timedelta(minutes=1)
+        )
+        assert len(database.get_reminders(1)) == 1
+        enqueue_reminders(fetch_reminders([rem_id]), now_epoch())
+        assert database.get_reminders(1) == [], (
+            'Сработавшее разовое напоминание должно пропасть из кэша'
+        )
+
+    def test_stale_read_is_not_cached(self):
+        cache = UserCache('test', maxsize=2, ttl=60)
+        hit, generation = cache.get(1)
+        assert not hit
+        cache.invalidate(1)
+        cache.put(1, ('старое',), generation)
+        assert not cache.get(1)[0], (
+            'Чтение, начатое до инвалидации, не должно попадать в кэш'
+        )
+
+    def test_generations_kept_only_for_reads_in_flight(self):
+        cache = UserCache('test', maxsize=1, ttl=60)
+        cache.invalidate(*range(1000))
+        assert cache._reads == {}, (
+            'Инвалидация без чтений не должна накапливать поколения'
+        )
+        hit, generation = cache.get(1)
+        cache.invalidate(1)
+        cache.put(2, (2,), cache.get(2)[1])
+        cache.put(3, (3,), cache.get(3)[1])
+        cache.put(1, ('старое',), generation)
+        assert not cache.get(1)[0], (
+            'Вытеснение не должно сбрасывать поколение читаемого ключа'
+        )
+        cache.release(1)
+        assert cache._reads == {}
+
+    def test_lru_eviction_and_ttl(self):
+        cache = UserCache('test', maxsize=2, ttl=60)
+        for user_id in (1, 2, 3):
+            cache.put(user_id, (user_id,), cache.get(user_id)[1])
+        assert not cache.get(1)[0], 'Самая старая запись должна вытесняться'
+        assert cache.get(3) == (True, (3,))
+
+        expiring = UserCache('test', maxsize=2, ttl=1e-9)
+        expiring.put(1, (1,), expiring.get(1)[1])
+        assert not expiring.get(1)[0], 'Запись должна устаревать по TTL'
+
+    def test_pages_are_cached_until_write(self, db_path):
+        database.add_shopping_items(1, [('молоко', 'еда', 1), ('хлеб', 'еда', 1)])
+        first = database.page_shopping_list(1, limit=1)
+        with DB() as cursor:
+            cursor.execute('DELETE FROM shopping_list')
+        assert database.page_shopping_list(1, limit=1) == first, (
+            'Повторный просмотр страницы должен обслуживаться из кэша'
+        )
+        database.add_shopping_item(1, 'сыр', 'еда')
+        assert [row[1] for row in database.page_shopping_list(1)] == ['сыр'], (
+            'Запись должна сбрасывать кэшированные страницы владельца'
+        )
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from dispatcher import MessageDispatcher, TokenBucket
+
+
+class FloodBot:
+    """Бот, отвечающий 429 на первые flood_count отправок"""
+
+    def __init__(self, flood_count=0, retry_after=0):
+        self.flood_count = flood_count
+        self.retry_after = retry_after
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        if self.flood_count:
+            self.flood_count -= 1
+            raise ApiTelegramException('sendMessage', None, {
+                'error_code': 429,
+                'description': 'Too Many Requests',
+                'parameters': {'retry_after': self.retry_after},
+            })
+        self.sent.append((chat_id, text))
+
+
+class TestDispatcher:
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.09, (
+            'Корзина токенов должна ограничивать скорость выдачи'
+        )
+
+    def test_workers_deliver_all(self):
+        bot = FloodBot()
+        dispatcher = MessageDispatcher(bot, workers=4, rate=1000,
+                                       chat_rate=1000)
+        chat_ids = iter(range(20))
+        lock = threading.Lock()
+
+        def worker():
+            errors = []
+            while True:
+                with lock:
+                    chat_id = next(chat_ids, None)
+                if chat_id is None:
+                    return errors
+                errors.append(dispatcher.send(chat_id, 'text'))
+
+        try:
+            results = dispatcher.run_workers(worker)
+        finally:
+            dispatcher.shutdown()
+        assert len(results) == 4 and all(
+            error is None for errors in results for error in errors
+        ), 'Все сообщения пачки должны быть доставлены'
+        assert len(bot.sent) == 20, (
+            'Все сообщения пачки должны быть доставлены'
+        )
+        assert dispatcher.stats()['sent'] == 20
+
+    def test_retry_after_is_honored(self):
+        bot = FloodBot(flood_count=1, retry_after=0.2)
+        dispatcher = MessageDispatcher(bot, workers=1, rate=1000,
+                                       chat_rate=1000)
+        start = time.monotonic()
+        try:
+            assert dispatcher.send(1, 'text') is None, (
+                'После ответа 429 сообщение должно быть отправлено повторно'
+            )
+        finally:
+            dispatcher.shutdown()
+        assert time.monotonic() - start >= 0.2, (
+            'Повторная отправка должна ждать retry_after'
+        )
+        assert dispatcher.stats()['retried'] == 1
@@ -0,0 +1,51 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import database
+import export
+
+
+class TestExport:
+
+    def test_csv_escapes_commas_and_newlines(self):
+        dt = datetime(2030, 1, 2, 3, 4)
+        result = export.export_reminders(
+            [(1, 'купить хлеб, молоко\nи сыр', dt, None)]
+        )
+        assert result.filename == 'reminders.csv'
+        rows = list(csv.reader(io.StringIO(result.file.read().decode())))
+        assert rows == [
+            ['ID', 'Текст', 'Дата', 'Повтор'],
+            ['1', 'купить хлеб, молоко\nи сыр', '02.01.2030 03:04', 'нет'],
+        ], 'Текст с запятой и переводом строки должен экранироваться'
+
+    def test_jsonl(self):
+        result = export.export_shopping_list(
+            [(1, 'молоко', 'продукты', 2)], fmt='jsonl'
+        )
+        assert result.filename == 'shopping_list.jsonl'
+        assert json.loads(result.file.read().decode()) == {
+            'id': 1, 'item': 'молоко', 'category': 'продукты', 'quantity': 2
+        }
+
+    def test_large_export_is_streamed_and_compressed(self, db_path):
+        dt = datetime.now() + timedelta(days=1)
+        with database.DB() as cursor:
+            cursor.executemany(
+                'INSERT INTO reminders (user_id, text, due_at, anchor_at) '
+                'VALUES (1, ?, ?, ?)',
+                [(f'напоминание {i}', database.to_epoch(dt),
+                  database.to_epoch(dt)) for i in range(5000)]
+            )
+        rows = database.iter_reminders(1, batch_size=100)
+        result = export.export_reminders(rows, threshold=1024)
+        assert result.rows == 5000
+        assert result.filename == 'reminders.csv.gz', (
+            'Файл больше порога должен сжиматься'
+        )
+        lines = gzip.decompress(result.file.read()).decode().splitlines()
+        assert len(lines) == 5001
+        assert lines[-1].startswith('5000,напоминание 4999,')
@@ -0,0 +1,52 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import export
+import importer
+from storage import MemoryStorage, SQLiteStorage
+
+
+class TestImport:
+
+    def test_round_trip_with_errors(self):
+        dt = (datetime.now() + timedelta(days=1)).replace(second=0,
+                                                          microsecond=0)
+        exported = export.export_reminders([
+            (1, 'купить хлеб, молоко\nи сыр', dt, 'weekly'),
+            (2, 'позвонить', dt, None),
+        ]).file.read()
+        data = exported + (
+            '3,старое,01.01.2000 10:00,нет\r\n'
+            '4,опечатка,31.02.2030 10:00,нет\r\n'
+            '5,странное,' + dt.strftime(export.DATE_FORMAT) + ',hourly\r\n'
+        ).encode()
+        storage = MemoryStorage()
+        result = importer.import_file(storage, 7, data, 'reminders.csv')
+        assert result.kind == 'reminders'
+        assert result.imported == 2
+        assert [line for line, _ in result.errors] == [5, 6, 7], (
+            'Ошибочные строки должны пропускаться с номером в отчёте'
+        )
+        assert [rem[1:] for rem in storage.get_reminders(7)] == [
+            ('купить хлеб, молоко\nи сыр', dt, 'weekly'),
+            ('позвонить', dt, None),
+        ]
+
+    def test_gzipped_jsonl_in_chunks(self, db_path):
+        lines = [
+            json.dumps({'item': f'товар {i}', 'category': 'нет'})
+            for i in range(2500)
+        ]
+        data = gzip.compress(
+            ('\n'.join(lines[:10] + ['{битый'] + lines[10:])).encode()
+        )
+        storage = SQLiteStorage(db_path)
+        result = importer.import_file(
+            storage, 1, data, 'shopping_list.jsonl.gz', chunk_size=1000
+        )
+        assert result.imported == 2500
+        assert result.errors[0][0] == 11
+        items = storage.get_shopping_list(1)
+        assert len(items) == 2500
+        assert items[0][2] == importer.DEFAULT_CATEGORY
@@ -0,0 +1,71 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from lanes import LaneExecutor, update_key
+from metrics import LANE_SATURATED
+
+
+def update(user_id, update_id=1):
+    return SimpleNamespace(
+        update_id=update_id,
+        message=SimpleNamespace(from_user=SimpleNamespace(id=user_id)),
+    )
+
+
+class TestLanes:
+
+    def test_update_key(self):
+        assert update_key(update(42)) == 42
+        call = SimpleNamespace(
+            update_id=7, callback_query=SimpleNamespace(
+                from_user=SimpleNamespace(id=5)
+            )
+        )
+        assert update_key(call) == 5
+        assert update_key(SimpleNamespace(update_id=9)) == 9
+
+    def test_user_order_and_parallel_users(self):
+        lanes = LaneExecutor(lanes=4, queue_size=100)
+        slow_user, fast_user = 0, 1
+        assert lanes.lane(slow_user) != lanes.lane(fast_user)
+        handled = []
+        fast_done = threading.Event()
+
+        def handle(user_id, step):
+            if user_id == slow_user:
+                time.sleep(0.01)
+            handled.append((user_id, step))
+            if user_id == fast_user:
+                fast_done.set()
+
+        for step in range(20):
+            lanes.submit(slow_user, handle, slow_user, step)
+        lanes.submit(fast_user, handle, fast_user, 0)
+        assert fast_done.wait(0.1), (
+            'Медленный пользователь не должен задерживать других'
+        )
+        lanes.shutdown()
+        steps = [step for user_id, step in handled if user_id == slow_user]
+        assert steps == list(range(20)), (
+            'Обновления одного пользователя обрабатываются по порядку'
+        )
+
+    def test_full_lane(self):
+        lanes = LaneExecutor(lanes=1, queue_size=1)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(1)
+
+        saturated = LANE_SATURATED.get()
+        assert lanes.submit(1, block)
+        started.wait(1)
+        assert lanes.submit(1, block)
+        assert lanes.depths() == [1]
+        assert not lanes.submit(1, block, block=False)
+        assert LANE_SATURATED.get() == saturated + 1
+        release.set()
+        lanes.shutdown()
+        assert not lanes.submit(1, block), 'После остановки полосы не принимают'
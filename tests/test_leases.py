@@ -0,0 +1,47 @@
+import time
+
+from database import DB
+from leases import ShardLeases, shard_filter
+import utils
+
+
+class TestShardLeases:
+
+    def test_workers_split_shards(self, db_path):
+        first = ShardLeases(shard_count=8, owner='first')
+        second = ShardLeases(shard_count=8, owner='second')
+        assert first.refresh() == set(range(8)), (
+            'Единственный процесс должен арендовать все шарды'
+        )
+        second.refresh()
+        first.refresh()
+        second.refresh()
+        assert len(first.owned) == len(second.owned) == 4, (
+            'Шарды должны делиться между процессами поровну'
+        )
+        assert not first.owned & second.owned, (
+            'Один шард не может принадлежать двум процессам'
+        )
+
+    def test_dead_worker_shards_are_taken_over(self, db_path):
+        dead = ShardLeases(shard_count=4, owner='dead', ttl=0.1)
+        alive = ShardLeases(shard_count=4, owner='alive')
+        dead.refresh()
+        assert alive.refresh() == set(), (
+            'Чужая действующая аренда не должна перехватываться'
+        )
+        time.sleep(0.15)
+        assert alive.refresh() == set(range(4)), (
+            'Шарды процесса с истёкшей арендой должны переходить к живым'
+        )
+
+    def test_sharded_due_query_uses_index(self, db_path):
+        condition, params = shard_filter({1, 3}, 4)
+        with DB() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN '
+                + utils.DUE_IDS_QUERY.format(shards=' AND ' + condition),
+                (1900000000, -1, 0, *params, utils.BATCH_SIZE)
+            )
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        assert 'USING COVERING INDEX idx_reminders_due_shard' in plan, plan
@@ -0,0 +1,39 @@
+import urllib.request
+
+import metrics
+
+
+class TestMetrics:
+
+    def test_prometheus_text_format(self):
+        counter = metrics.Counter('test_failures_total', 'Ошибки')
+        histogram = metrics.Histogram('test_delay_seconds', 'Задержка', (1, 5))
+        try:
+            counter.inc(error='ApiTelegramException:403')
+            histogram.observe(0.5)
+            histogram.observe(3)
+            text = metrics.render()
+        finally:
+            metrics.REGISTRY.remove(counter)
+            metrics.REGISTRY.remove(histogram)
+        assert '# TYPE test_failures_total counter' in text
+        assert (
+            'test_failures_total{error="ApiTelegramException:403"} 1' in text
+        ), 'Счётчик ошибок должен выводиться с меткой класса ошибки'
+        assert 'test_delay_seconds_bucket{le="1"} 1' in text
+        assert 'test_delay_seconds_bucket{le="5"} 2' in text
+        assert 'test_delay_seconds_bucket{le="+Inf"} 2' in text
+        assert 'test_delay_seconds_count 2' in text
+
+    def test_http_endpoint(self):
+        server = metrics.start_http_server(0)
+        try:
+            port = server.server_address[1]
+            with urllib.request.urlopen(
+                f'http://127.0.0.1:{port}/metrics', timeout=1
+            ) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+        assert 'reminder_delivery_delay_seconds_bucket' in body
+        assert 'messages_failed_total' in body
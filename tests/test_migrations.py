@@ -0,0 +1,108 @@
+import sqlite3
+
+import migrations
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY, created DATETIME,
+        timezone TEXT DEFAULT 'UTC'
+    );
+    CREATE TABLE reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, text TEXT,
+        datetime DATETIME, repeat TEXT, is_active BOOLEAN DEFAULT 1
+    );
+    CREATE TABLE shopping_list (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, item TEXT,
+        category TEXT, created DATETIME
+    );
+'''
+
+
+def indexes(conn):
+    return {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )}
+
+
+class TestMigrations:
+
+    def test_legacy_database_is_upgraded(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'legacy.db'))
+        conn.executescript(LEGACY_SCHEMA)
+        conn.executemany(
+            'INSERT INTO reminders (user_id, text, datetime) VALUES (?, ?, ?)',
+            [(1, f'r{i}', '2024-05-01 09:30:00') for i in range(5)]
+        )
+        conn.executemany(
+            'INSERT INTO shopping_list (user_id, item, category) '
+            'VALUES (?, ?, ?)',
+            [(1, 'молоко', 'еда'), (1, 'хлеб', 'еда'), (1, 'молоко', 'еда')]
+        )
+        conn.commit()
+
+        version = migrations.migrate(conn)
+        assert version == migrations.MIGRATIONS[-1][0], (
+            'После миграции user_version должен равняться последней версии'
+        )
+        assert {
+            'idx_reminders_due_shard', 'idx_outbox_pending',
+            'idx_shopping_list_item', 'idx_reminders_user',
+        } <= indexes(conn), 'Миграции должны создавать индексы'
+        assert conn.execute(
+            'SELECT item, quantity FROM shopping_list ORDER BY id'
+        ).fetchall() == [('молоко', 2), ('хлеб', 1)], (
+            'Дубли товаров должны сливаться в одну строку с количеством'
+        )
+
+        # 5 дат напоминаний, 5 напоминаний и 2 товара в индексах поиска
+        assert migrations.run_backfills(conn, batch_size=2) == 12
+        assert conn.execute(
+            'SELECT COUNT(*) FROM reminders WHERE due_at IS NULL'
+        ).fetchone()[0] == 0, 'Перенос дат должен обработать все строки'
+        assert conn.execute(
+            "SELECT COUNT(*) FROM shopping_fts "
+            "WHERE shopping_fts MATCH 'user_id : \"1\" AND молоко'"
+        ).fetchone()[0] == 1, 'Старые строки должны попасть в индекс поиска'
+        assert migrations.run_backfills(conn, batch_size=2) == 0, (
+            'Повторный перенос не должен индексировать строки заново'
+        )
+        conn.close()
+
+    def test_migrate_is_idempotent(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'fresh.db'))
+        migrations.migrate(conn)
+        applied = []
+        migrations.MIGRATIONS.append(
+            (migrations.MIGRATIONS[-1][0] + 1, applied.append)
+        )
+        try:
+            migrations.migrate(conn)
+            migrations.migrate(conn)
+        finally:
+            migrations.MIGRATIONS.pop()
+        assert len(applied) == 1, (
+            'Каждая миграция должна применяться ровно один раз'
+        )
+        conn.close()
+
+    def test_failed_migration_is_rolled_back(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'fresh.db'))
+        version = migrations.migrate(conn)
+
+        def broken(cursor):
+            cursor.execute('CREATE TABLE half_done (id INTEGER)')
+            raise RuntimeError('boom')
+
+        migrations.MIGRATIONS.append((version + 1, broken))
+        try:
+            try:
+                migrations.migrate(conn)
+            except RuntimeError:
+                pass
+        finally:
+            migrations.MIGRATIONS.pop()
+        assert migrations.schema_version(conn) == version
+        assert not conn.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'half_done'"
+        ).fetchall(), 'Прерванная миграция не должна оставлять изменений'
+        conn.close()
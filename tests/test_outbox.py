@@ -0,0 +1,113 @@
+import time
+
+import outbox
+from database import DB
+
+
+class StubDispatcher:
+    """Диспетчер в один поток, возвращающий заданные ошибки по очереди"""
+    workers = 1
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        return self.errors.pop(0) if self.errors else None
+
+    def run_workers(self, function):
+        return [function()]
+
+
+def outbox_rows():
+    with DB() as cursor:
+        cursor.execute('SELECT status, attempts, last_error FROM outbox')
+        return cursor.fetchall()
+
+
+class TestOutbox:
+
+    def test_enqueue_is_idempotent(self, db_path):
+        with DB() as cursor:
+            outbox.enqueue(cursor, 'reminder:1:x', 1, 0, 10, 'text')
+            outbox.enqueue(cursor, 'reminder:1:x', 1, 0, 10, 'text')
+        sender = outbox.OutboxSender(StubDispatcher())
+        assert sender.drain() == 1, (
+            'Повторная постановка с тем же ключом не должна создавать '
+            'вторую отправку'
+        )
+        assert outbox_rows() == [('sent', 1, None)]
+
+    def test_failed_send_backs_off_then_dead_letters(
+            self, db_path, monkeypatch
+    ):
+        monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 2)
+        with DB() as cursor:
+            outbox.enqueue(cursor, 'key', 1, 0, 10, 'text')
+        sender = outbox.OutboxSender(
+            StubDispatcher([RuntimeError('boom'), RuntimeError('boom')])
+        )
+        sender.drain()
+        assert outbox_rows() == [('pending', 1, 'boom')], (
+            'Неудачная отправка должна вернуть запись в очередь'
+        )
+        assert sender.drain() == 0, (
+            'Повторная попытка не должна выполняться до истечения задержки'
+        )
+        with DB() as cursor:
+            cursor.execute('UPDATE outbox SET next_attempt_at = 0')
+        sender.drain()
+        assert outbox_rows() == [('dead', 2, 'boom')], (
+            'После MAX_ATTEMPTS запись должна попасть в dead-letter'
+        )
+
+    def test_interrupted_send_is_not_repeated(self, db_path):
+        with DB() as cursor:
+            outbox.enqueue(cursor, 'key', 1, 0, 10, 'text')
+        outbox.OutboxSender(StubDispatcher()).claim(float('inf'))
+        dispatcher = StubDispatcher()
+        # Процесс, захвативший запись, упал; следующий видит захват старым
+        sender = outbox.OutboxSender(dispatcher)
+        sender.recover(time.time() + outbox.CLAIM_TIMEOUT + 1)
+        sender.drain()
+        assert dispatcher.sent == [], (
+            'Запись, отправка которой была прервана, не должна '
+            'отправляться повторно'
+        )
+        assert outbox_rows()[0][0] == 'dead'
+
+    def test_restart_loses_only_messages_in_flight(self, db_path):
+        with DB() as cursor:
+            for n in range(3):
+                outbox.enqueue(cursor, f'key{n}', n, 0, 10, f'text{n}')
+        outbox.OutboxSender(StubDispatcher()).claim(float('inf'))
+        sender = outbox.OutboxSender(StubDispatcher())
+        sender.recover(time.time() + outbox.CLAIM_TIMEOUT + 1)
+        assert sender.drain() == 2, (
+            'Записи, отправка которых не начиналась, должны быть '
+            'отправлены после перезапуска'
+        )
+        assert sorted(row[0] for row in outbox_rows()) == [
+            'dead', 'sent', 'sent'
+        ]
+
+    def test_other_process_claims_are_kept(self, db_path):
+        with DB() as cursor:
+            for n in range(2):
+                outbox.enqueue(cursor, f'key{n}', n, 0, 10, f'text{n}')
+        other = outbox.OutboxSender(StubDispatcher())
+        sending = other.claim(float('inf'))
+        outbox.OutboxSender(StubDispatcher()).recover()
+        assert sorted(row[0] for row in outbox_rows()) == [
+            'pending', 'sending'
+        ], 'Запуск процесса не должен трогать отправки других процессов'
+
+        other.deliver(sending, time.time())
+        orphan = other.claim(float('inf'))
+        other.recover()
+        other.deliver(orphan, time.time())
+        assert sorted(row[0] for row in outbox_rows()) == ['dead', 'sent'], (
+            'Свой брошенный захват снимается, и запоздавший результат '
+            'не возвращает запись из dead-letter'
+        )
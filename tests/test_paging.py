@@ -0,0 +1,79 @@
+import pytest
+
+from database import DB
+from paging import Page, clip, fit_page, load_page
+
+
+@pytest.fixture
+def storage(storage):
+    storage.add_shopping_items(
+        1, [(f'товар {i}', 'еда', 1) for i in range(25)]
+    )
+    storage.add_shopping_item(2, 'чужой', 'еда')
+    return storage
+
+
+def names(page):
+    return [row[1] for row in page.rows]
+
+
+class TestPaging:
+
+    def test_forward_and_back(self, storage):
+        fetch = storage.page_shopping_list
+        first = load_page(fetch, 1, size=10)
+        assert names(first) == [f'товар {i}' for i in range(10)]
+        assert (first.has_prev, first.has_next) == (False, True)
+
+        last = load_page(fetch, 1, after=load_page(
+            fetch, 1, after=first.rows[-1][0], size=10
+        ).rows[-1][0], size=10)
+        assert names(last) == [f'товар {i}' for i in range(20, 25)], (
+            'Страница должна начинаться после последнего id предыдущей'
+        )
+        assert (last.has_prev, last.has_next) == (True, False)
+
+        back = load_page(fetch, 1, before=last.rows[0][0], size=10)
+        assert names(back) == [f'товар {i}' for i in range(10, 20)]
+        assert (back.has_prev, back.has_next) == (True, True)
+
+    def test_emptied_page_falls_back_to_first(self, storage):
+        fetch = storage.page_shopping_list
+        first = load_page(fetch, 1, size=30)
+        page = load_page(fetch, 1, after=first.rows[-1][0], size=10)
+        assert names(page)[0] == 'товар 0', (
+            'Опустевшая страница должна сменяться первой'
+        )
+
+    def test_page_query_uses_index(self, db_path):
+        with DB() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT id, item, category, quantity '
+                'FROM shopping_list WHERE user_id = ? AND id > ? '
+                'ORDER BY id LIMIT ?',
+                (1, 0, 10)
+            )
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        assert 'idx_shopping_list_page' in plan
+        assert 'TEMP B-TREE' not in plan, 'Страница не должна сортироваться'
+
+    def test_clip(self):
+        assert clip('коротко') == 'коротко'
+        assert clip('x' * 500, 10) == 'x' * 9 + '…'
+
+    def test_page_is_cut_to_message_limit(self):
+        page = Page([(i, 'x' * 300) for i in range(10)], False, False)
+
+        def render(page):
+            return '\n'.join(row[1] for row in page.rows), None
+
+        fitted, text, _ = fit_page(page, render, limit=1000)
+        assert len(text) <= 1000 and len(fitted.rows) == 3, (
+            'Страница должна укорачиваться до лимита длины сообщения'
+        )
+        assert (fitted.has_prev, fitted.has_next) == (False, True), (
+            'До отброшенных строк должно быть можно долистать'
+        )
+        fitted, _, _ = fit_page(page, render, backward=True, limit=1000)
+        assert [row[0] for row in fitted.rows] == [7, 8, 9]
+        assert fitted.has_prev
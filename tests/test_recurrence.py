@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from database import to_epoch
+from recurrence import next_occurrence
+
+
+def epoch(*args):
+    return to_epoch(datetime(*args))
+
+
+class TestRecurrence:
+
+    def test_monthly_keeps_calendar_day(self):
+        anchor = epoch(2024, 1, 31, 9, 0)
+        feb = next_occurrence('monthly', anchor, anchor, anchor)
+        assert datetime.fromtimestamp(feb) == datetime(2024, 2, 29, 9, 0), (
+            'Ежемесячное напоминание 31-го должно срабатывать в последний '
+            'день короткого месяца'
+        )
+        mar = next_occurrence('monthly', anchor, feb, feb)
+        assert datetime.fromtimestamp(mar) == datetime(2024, 3, 31, 9, 0), (
+            'Ежемесячное напоминание не должно сползать после короткого '
+            'месяца'
+        )
+
+    def test_yearly_is_calendar_year(self):
+        anchor = epoch(2023, 3, 1, 8, 0)
+        nxt = next_occurrence('yearly', anchor, anchor, anchor)
+        assert datetime.fromtimestamp(nxt) == datetime(2024, 3, 1, 8, 0)
+
+    def test_catch_up_after_downtime_in_one_step(self):
+        anchor = epoch(2024, 1, 1, 9, 0)
+        now = epoch(2024, 1, 8, 12, 0)
+        nxt = next_occurrence('daily', anchor, anchor, now)
+        assert datetime.fromtimestamp(nxt) == datetime(2024, 1, 9, 9, 0), (
+            'После простоя следующий срок должен быть первым после now'
+        )
+
+    def test_next_is_strictly_after_current_due(self):
+        due = epoch(2024, 1, 1, 9, 0)
+        nxt = next_occurrence('weekly', due, due, due - 3)
+        assert nxt == epoch(2024, 1, 8, 9, 0), (
+            'Срок, сработавший чуть раньше времени, не должен повторяться'
+        )
+
+    def test_custom_rule(self):
+        anchor = epoch(2024, 1, 1, 9, 0)  # понедельник
+        nxt = next_occurrence(
+            'FREQ=WEEKLY;BYDAY=MO,FR', anchor, anchor, anchor
+        )
+        assert datetime.fromtimestamp(nxt) == datetime(2024, 1, 5, 9, 0)
+
+    def test_unknown_rule_stops_repeating(self):
+        assert next_occurrence('hourly?', 0, 0, 0) is None
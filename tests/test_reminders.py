@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import database
+import metrics
+import utils
+from storage import SQLiteStorage
+
+
+class TestReminderQueries:
+
+    def test_due_query_uses_index(self, db_path):
+        with database.DB() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN ' + utils.DUE_IDS_QUERY.format(shards=''),
+                (1900000000, -1, 0, utils.BATCH_SIZE)
+            )
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        assert 'USING COVERING INDEX idx_reminders_due_shard' in plan, (
+            'Выборка наступивших напоминаний должна идти по индексу '
+            f'idx_reminders_due_shard, а не полным сканированием: {plan}'
+        )
+        assert 'SCAN' not in plan, (
+            f'Выборка наступивших напоминаний сканирует таблицу: {plan}'
+        )
+
+    def test_due_batches_are_bounded(self, db_path):
+        with database.DB() as cursor:
+            cursor.executemany(
+                'INSERT INTO reminders (user_id, text, due_at) '
+                'VALUES (?, ?, ?)',
+                [(1, f'r{i}', 1600000000 + i % 7) for i in range(25)]
+                + [(1, 'future', 4000000000)]
+            )
+        batches = list(utils.iter_due_batches(1700000000, batch_size=10))
+        assert [len(batch) for batch in batches] == [10, 10, 5], (
+            'Наступившие напоминания должны выбираться пачками по LIMIT'
+        )
+        ids = [rem_id for batch in batches for rem_id, _ in batch]
+        assert len(set(ids)) == 25, (
+            'Пачки не должны пересекаться и не должны включать '
+            'ненаступившие напоминания'
+        )
+
+
+class TestEpochMigration:
+
+    def test_text_dates_are_converted(self, db_path):
+        with database.DB() as cursor:
+            cursor.executemany(
+                'INSERT INTO reminders (user_id, text, datetime) '
+                'VALUES (?, ?, ?)',
+                [(1, 'plain', '2024-05-01 09:30:00'),
+                 (1, 'micro', '2024-05-01 09:30:00.123456'),
+                 (1, 'broken', 'not a date')]
+            )
+        assert database.run_backfills(batch_size=2) == 3
+        with database.DB() as cursor:
+            cursor.execute(
+                'SELECT text, due_at, anchor_at, is_active FROM reminders '
+                'ORDER BY id'
+            )
+            rows = cursor.fetchall()
+        expected = database.to_epoch(datetime(2024, 5, 1, 9, 30))
+        assert rows == [
+            ('plain', expected, expected, 1),
+            ('micro', expected, expected, 1),
+            ('broken', 0, 0, 0),
+        ], 'Текстовые даты (в том числе с микросекундами) должны '
+        'переноситься в due_at и anchor_at, нераспознанные — отключаться'
+
+    def test_legacy_reminders_are_readable_during_backfill(self, db_path):
+        with database.DB() as cursor:
+            cursor.execute(
+                'INSERT INTO reminders (user_id, text, datetime) '
+                "VALUES (1, 'старое', '2030-01-31 09:00:00')"
+            )
+            cursor.execute(
+                'INSERT INTO reminders (user_id, text, datetime) '
+                "VALUES (1, 'сломанное', 'not a date')"
+            )
+            # Перенесённое раньше без опорной даты
+            cursor.execute(
+                'INSERT INTO reminders (user_id, text, due_at, repeat) '
+                "VALUES (1, 'ежемесячное', 1000, 'monthly')"
+            )
+        storage = SQLiteStorage(db_path)
+        expected = [
+            ('старое', datetime(2030, 1, 31, 9, 0)),
+            ('ежемесячное', datetime.fromtimestamp(1000)),
+        ]
+        assert [row[1:3] for row in storage.page_reminders(1)] == expected, (
+            'До переноса срок берётся из старой колонки datetime, '
+            'нераспознанные даты пропускаются'
+        )
+        assert [row[1:3] for row in storage.iter_reminders(1)] == expected
+
+        reloaded = []
+        scheduler = SimpleNamespace(reload_soon=lambda: reloaded.append(True))
+        utils.backfill(scheduler)
+        assert reloaded, 'После переноса планировщик перечитывает очередь'
+        assert storage.search(1, 'старое')[0]
+        with database.DB() as cursor:
+            cursor.execute(
+                'SELECT COUNT(*) FROM reminders WHERE anchor_at IS NULL'
+            )
+            assert cursor.fetchone()[0] == 0, (
+                'Повторы должны считаться от опорной даты'
+            )
+
+
+class RecordingBot:
+
+    def __init__(self):
+        self.sent = threading.Event()
+        self.sent_at = None
+
+    def send_message(self, chat_id, text):
+        self.sent_at = time.time()
+        self.sent.set()
+
+
+class TestScheduler:
+
+    def test_new_reminder_fires_on_time(self, db_path, monkeypatch):
+        monkeypatch.setattr(database, '_reminder_listeners', [])
+        bot = RecordingBot()
+        scheduler = utils.ReminderScheduler(bot)
+        threads = [
+            threading.Thread(target=scheduler.run, daemon=True),
+            threading.Thread(target=scheduler.sender.run, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            self.check_delivery(bot)
+        finally:
+            # Потоки не должны пережить тест и обращаться к чужой базе
+            scheduler.stop()
+            for thread in threads:
+                thread.join(1)
+        assert not any(thread.is_alive() for thread in threads), (
+            'Планировщик и отправитель должны останавливаться по stop()'
+        )
+
+    def check_delivery(self, bot):
+        delivered = metrics.DELIVERY_DELAY.count
+        due_at = int(time.time()) + 1
+        database.add_reminder(1, 'text', datetime.fromtimestamp(due_at))
+        assert bot.sent.wait(1.5), (
+            'Созданное напоминание должно быть отправлено без ожидания '
+            'периодического опроса'
+        )
+        assert 0 <= bot.sent_at - due_at < 0.5, (
+            'Напоминание должно отправляться не раньше срока и с '
+            'задержкой меньше секунды'
+        )
+        deadline = time.time() + 0.3
+        while (metrics.DELIVERY_DELAY.count == delivered
+               and time.time() < deadline):
+            time.sleep(0.01)
+        assert metrics.DELIVERY_DELAY.count == delivered + 1, (
+            'Задержка доставки должна попадать в гистограмму'
+        )
@@ -0,0 +1,37 @@
+import time
+
+import database
+import retention
+from database import DB, get_connection
+
+
+class TestRetention:
+
+    def test_old_inactive_reminders_are_archived(self, db_path):
+        old = int(time.time()) - 40 * 86400
+        recent = int(time.time()) - 86400
+        with DB() as cursor:
+            cursor.executemany(
+                'INSERT INTO reminders '
+                '(user_id, text, due_at, anchor_at, is_active) '
+                'VALUES (1, ?, ?, ?, ?)',
+                [('старое ' + 'x' * 2000, old, old, 0)] * 300
+                + [('свежее', recent, recent, 0), ('активное', old, old, 1)]
+            )
+        archived, reclaimed = retention.run_retention(days=30, batch_size=100)
+        assert archived == 300
+        with DB() as cursor:
+            cursor.execute('SELECT text FROM reminders ORDER BY id')
+            assert [row[0] for row in cursor.fetchall()] == [
+                'свежее', 'активное'
+            ], 'В архив уходят только неактивные старше срока хранения'
+        assert get_connection().execute(
+            'PRAGMA auto_vacuum'
+        ).fetchone()[0] == retention.AUTO_VACUUM_INCREMENTAL
+        assert reclaimed > 0, 'Освободившееся место должно возвращаться'
+
+        rows = list(database.iter_archived_reminders(1))
+        assert len(rows) == 300 and rows[0][1].startswith('старое'), (
+            'Архив должен оставаться доступным для выгрузки'
+        )
+        assert retention.run_retention(days=30)[0] == 0
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+from metrics import DISPATCH_DURATION
+from routing import Router
+from states import MemoryStateStore
+
+
+def message(text, content_type='text', user_id=1):
+    return SimpleNamespace(
+        text=text, content_type=content_type,
+        from_user=SimpleNamespace(id=user_id),
+    )
+
+
+class TestRouter:
+
+    def make_router(self):
+        states = MemoryStateStore()
+        router = Router(states)
+        handled = []
+        for name in ('start', 'export'):
+            router.command(name)(lambda m, name=name: handled.append(name))
+        router.text('📝 Напоминания')(lambda m: handled.append('menu'))
+        router.step('item')(lambda m: handled.append('item'))
+        router.step('import', content_types=['document'])(
+            lambda m: handled.append('import')
+        )
+        router.callback('delete_item')(lambda c: handled.append('keyboard'))
+        router.callback_prefix('delete_item_')(
+            lambda c: handled.append('delete')
+        )
+        return router, states, handled
+
+    def test_message_routes(self, monkeypatch):
+        router, states, handled = self.make_router()
+        router.dispatch_message(message('/export@my_bot csv'))
+        router.dispatch_message(message('молоко'))
+        states.set(1, {'step': 'item'})
+        router.dispatch_message(message('молоко'))
+        router.dispatch_message(message('/start'))
+        router.dispatch_message(message('📝 Напоминания'))
+        assert handled == ['export', 'item', 'start', 'menu'], (
+            'Команда и кнопка меню важнее шага диалога, '
+            'без совпадений сообщение не обрабатывается'
+        )
+
+        states.set(1, {'step': 'import'})
+        router.dispatch_message(message('текст вместо файла'))
+        router.dispatch_message(message(None, content_type='document'))
+        assert handled[-1] == 'import' and len(handled) == 5, (
+            'Шаг должен принимать только свои типы сообщений'
+        )
+
+    def test_callback_routes_and_timing(self):
+        router, _, handled = self.make_router()
+        count = DISPATCH_DURATION.count
+        for data in ('delete_item', 'delete_item_5', 'unknown'):
+            router.dispatch_callback(SimpleNamespace(data=data))
+        assert handled == ['keyboard', 'delete']
+        assert DISPATCH_DURATION.count == count + 3, (
+            'Время обработки должно учитываться для каждого обновления'
+        )
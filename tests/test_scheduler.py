@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+import database
+import utils
+
+
+def moment(seconds=0):
+    """Срок напоминания через seconds секунд"""
+    return utils.now_epoch() + seconds
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(database, '_reminder_listeners', [])
+    scheduler = utils.ReminderScheduler(None)
+    # Без предзагрузки и обслуживания: очередь наполняет только тест
+    scheduler._loaded_until = moment(3600)
+    scheduler._maintain_at = moment(3600)
+    yield scheduler
+    scheduler.stop()
+
+
+class TestReminderScheduler:
+
+    def test_due_reminders_pop_in_time_order(self, scheduler):
+        for rem_id, offset in ((1, -1), (2, -3), (3, -2)):
+            scheduler.schedule(rem_id, moment(offset))
+        scheduler.schedule(4, moment(1800))
+        assert scheduler.pop_due() == [2, 3, 1], (
+            'Наступившие напоминания извлекаются по возрастанию срока, '
+            'будущие остаются в очереди'
+        )
+        assert list(scheduler._due) == [4]
+
+    def test_cancel_and_reschedule(self, scheduler):
+        scheduler.schedule(1, moment(-2))
+        scheduler.schedule(2, moment(-2))
+        database._notify_reminder(1, None)
+        scheduler.schedule(2, moment(-1))
+        assert scheduler.pop_due() == [2], (
+            'Удалённое напоминание не срабатывает, перенесённое '
+            'срабатывает один раз'
+        )
+
+    def test_new_reminder_wakes_waiting_loop(self, scheduler):
+        popped = []
+        waiter = threading.Thread(
+            target=lambda: popped.append(scheduler.pop_due()), daemon=True
+        )
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive(), 'Пустая очередь ждёт до горизонта'
+        database._notify_reminder(7, moment())
+        waiter.join(1)
+        assert popped == [[7]], (
+            'Новое ближайшее напоминание должно будить планировщик'
+        )
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from database import DB
+from storage import SQLiteStorage
+
+
+class TestSearch:
+
+    def test_find_by_word_prefixes(self, storage):
+        dt = datetime.now() + timedelta(days=1)
+        storage.add_reminder(1, 'Позвонить маме насчёт дачи', dt)
+        storage.add_reminder(1, 'Купить подарок', dt)
+        storage.add_reminder(2, 'Позвонить маме', dt)
+        storage.add_shopping_items(1, [
+            ('Молоко', 'Молочное', 1), ('Хлеб', 'Выпечка', 1)
+        ])
+
+        reminders, items = storage.search(1, 'позвон мам')
+        assert [rem[1] for rem in reminders] == [
+            'Позвонить маме насчёт дачи'
+        ], 'Поиск должен находить по началам слов только у владельца'
+        assert items == []
+
+        reminders, items = storage.search(1, 'молочн')
+        assert reminders == [] and [item[1] for item in items] == ['Молоко']
+        assert storage.search(1, '"*)') == ([], [])
+
+    def test_index_follows_changes(self, db_path):
+        storage = SQLiteStorage(db_path)
+        rem_id = storage.add_reminder(
+            1, 'полить цветы', datetime.now() + timedelta(days=1)
+        )
+        with DB() as cursor:
+            cursor.execute(
+                'UPDATE reminders SET text = ? WHERE id = ?',
+                ('покормить кота', rem_id)
+            )
+        assert storage.search(1, 'цветы') == ([], [])
+        assert len(storage.search(1, 'кота')[0]) == 1
+        storage.delete_reminder(rem_id)
+        assert storage.search(1, 'кота') == ([], []), (
+            'Удалённое напоминание должно пропадать из индекса'
+        )
+
+    def test_search_scans_only_owner_rows(self, db_path):
+        storage = SQLiteStorage(db_path)
+        for user_id in range(2, 52):
+            storage.add_shopping_items(user_id, [('молоко', 'еда', 1)])
+        storage.add_shopping_items(1, [
+            (f'молоко {i}', 'еда', 1) for i in range(12)
+        ])
+        items = storage.search(1, 'молоко')[1]
+        with DB() as cursor:
+            cursor.execute(
+                'SELECT id FROM shopping_list WHERE user_id = 1'
+            )
+            owner_ids = {row[0] for row in cursor.fetchall()}
+            # Тот же запрос, что строит search: отбор по user_id внутри FTS
+            cursor.execute(
+                'SELECT rowid FROM shopping_fts WHERE shopping_fts MATCH ?',
+                ('user_id : "1" AND ("молоко"*)',)
+            )
+            matched = {row[0] for row in cursor.fetchall()}
+        assert len(items) == 10 and {item[0] for item in items} <= owner_ids, (
+            'Поиск должен возвращать не больше limit товаров владельца'
+        )
+        assert matched == owner_ids, (
+            'Индекс поиска должен отбирать строки владельца сам, '
+            'без перебора строк других пользователей'
+        )
@@ -0,0 +1,20 @@
+from shopping import parse_items
+
+
+class TestParseItems:
+
+    def test_single_item(self):
+        assert parse_items('молоко') == [('молоко', None)]
+
+    def test_lines_commas_and_categories(self):
+        text = 'Молочное: молоко, кефир\n- хлеб\n• мыло,  \nДом:губки'
+        assert parse_items(text) == [
+            ('молоко', 'Молочное'),
+            ('кефир', 'Молочное'),
+            ('хлеб', None),
+            ('мыло', None),
+            ('губки', 'Дом'),
+        ], 'Префикс категории должен относиться к товарам своей строки'
+
+    def test_colon_without_items_is_not_a_category(self):
+        assert parse_items('Молочное:') == [('Молочное:', None)]
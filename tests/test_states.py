@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+
+from states import MemoryStateStore, SQLiteStateStore
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def store(request):
+    if request.param == 'memory':
+        return MemoryStateStore()
+    request.getfixturevalue('db_path')
+    return SQLiteStateStore()
+
+
+class TestStateStore:
+
+    def test_round_trip(self, store):
+        dt = datetime(2030, 5, 1, 9, 30)
+        store.set(1, {'step': 'reminder_repeat', 'text': 'т', 'date': dt})
+        assert store.get(1) == {
+            'step': 'reminder_repeat', 'text': 'т', 'date': dt
+        }, 'Состояние, включая дату, должно сохраняться без изменений'
+        assert store.step(1) == 'reminder_repeat'
+        assert store.get(2) is None and store.step(2) is None
+        store.delete(1)
+        assert store.get(1) is None
+
+    def test_abandoned_state_expires(self, store):
+        store.ttl = -1
+        store.set(1, {'step': 'reminder_text'})
+        assert store.get(1) is None, (
+            'Брошенный диалог должен удаляться по истечении TTL'
+        )
+
+    def test_sqlite_state_survives_restart(self, db_path):
+        SQLiteStateStore().set(1, {'step': 'item'})
+        assert SQLiteStateStore().step(1) == 'item'
+
+    def test_memory_store_is_bounded(self):
+        store = MemoryStateStore(maxsize=2)
+        for user_id in (1, 2):
+            store.set(user_id, {'step': 'item'})
+        store.get(1)
+        store.set(3, {'step': 'item'})
+        assert len(store) == 2
+        assert store.get(2) is None, 'Вытесняться должен давно не активный'
+        assert store.step(1) == 'item'
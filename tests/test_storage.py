@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage import create_storage
+
+
+class TestStorage:
+
+    def test_reminders(self, storage):
+        dt = (datetime.now() + timedelta(hours=1)).replace(microsecond=0)
+        rem_id = storage.add_reminder(1, 'позвонить', dt, repeat='daily')
+        storage.add_reminder(2, 'чужое', dt)
+        assert storage.get_reminders(1) == [
+            (rem_id, 'позвонить', dt, 'daily')
+        ], 'Хранилище должно возвращать напоминания только владельца'
+        storage.delete_reminder(rem_id)
+        assert storage.get_reminders(1) == []
+        assert len(storage.get_reminders(2)) == 1
+
+    def test_shopping_list(self, storage):
+        storage.add_user(1)
+        storage.add_user(1)
+        storage.add_shopping_item(1, 'молоко', 'продукты')
+        storage.add_shopping_items(1, [
+            ('мыло', 'дом', 1), ('молоко', 'продукты', 1),
+            ('молоко', 'молочное', 1),
+        ])
+        storage.add_shopping_item(2, 'хлеб', 'продукты')
+        items = storage.get_shopping_list(1)
+        assert [item[1:] for item in items] == [
+            ('молоко', 'продукты', 2), ('мыло', 'дом', 1),
+            ('молоко', 'молочное', 1),
+        ], 'Повторный товар той же категории должен увеличивать количество'
+        # id товара приходит из callback_data строкой
+        storage.delete_shopping_item(str(items[0][0]))
+        assert [item[1] for item in storage.get_shopping_list(1)] == [
+            'мыло', 'молоко'
+        ]
+        storage.add_shopping_item(1, 'молоко', 'продукты')
+        assert storage.get_shopping_list(1)[-1][1:] == (
+            'молоко', 'продукты', 1
+        ), 'Удалённый товар должен добавляться заново'
+        storage.delete_all_shopping_items(1)
+        assert storage.get_shopping_list(1) == [], (
+            'Очистка должна удалять весь список пользователя'
+        )
+        assert len(storage.get_shopping_list(2)) == 1
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            create_storage('redis')
@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import threading
+
+import telebot  # type: ignore
+
+from lanes import LaneExecutor
+from webhook import ProcessLock, WebhookApp, webhook_path
+
+SECRET = 'secret'
+
+
+def recorded_update(update_id, text='молоко'):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'test'},
+            'text': text,
+        },
+    }
+
+
+def request(app, payload, secret=SECRET, path='/hook', method='POST'):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    if secret is not None:
+        environ['HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'] = secret
+    return app.handle(environ)[0]
+
+
+class TestWebhook:
+
+    def make_app(self, handler, **options):
+        bot = telebot.TeleBot('1234:test', threaded=False)
+        bot.register_message_handler(handler)
+        return WebhookApp(bot, SECRET, path='/hook', **options)
+
+    def test_recorded_updates_are_processed(self):
+        received = []
+        app = self.make_app(lambda message: received.append(message.text))
+        assert request(app, recorded_update(1)) == '200 OK'
+        batch = [recorded_update(2, 'хлеб'), recorded_update(3, 'сыр')]
+        assert request(app, batch) == '200 OK'
+        app.shutdown()
+        assert sorted(received) == ['молоко', 'сыр', 'хлеб'], (
+            'Принятые обновления должны дойти до обработчиков'
+        )
+
+    def test_invalid_requests_are_rejected(self):
+        received = []
+        app = self.make_app(received.append)
+        assert request(app, recorded_update(1), secret=None) == '403 Forbidden'
+        assert request(app, recorded_update(1), secret='x') == '403 Forbidden'
+        assert request(app, b'{not json') == '400 Bad Request'
+        assert request(app, {'message': {}}) == '400 Bad Request'
+        assert request(app, recorded_update(1), path='/') == '404 Not Found'
+        assert request(
+            app, recorded_update(1), method='GET'
+        ) == '405 Method Not Allowed'
+        app.shutdown()
+        assert received == [], 'Отклонённые запросы не должны обрабатываться'
+
+    def test_without_secret_every_request_is_rejected(self):
+        received = []
+        bot = telebot.TeleBot('1234:test', threaded=False)
+        bot.register_message_handler(received.append)
+        app = WebhookApp(bot, path='/hook')
+        assert request(app, recorded_update(1)) == '403 Forbidden'
+        assert request(app, recorded_update(2), secret='') == '403 Forbidden'
+        app.shutdown()
+        assert received == [], (
+            'Без настроенного секрета webhook не должен принимать обновления'
+        )
+
+    def test_only_one_process_serves_updates(self, tmp_path):
+        received = []
+        path = str(tmp_path / 'webhook.lock')
+        app = self.make_app(received.append, lock=ProcessLock(path))
+        assert request(app, recorded_update(1)) == '200 OK'
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # Второй рабочий процесс с тем же приложением
+            status = request(app, recorded_update(2))
+            os.write(write, status.encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert os.read(read, 100) == b'503 Service Unavailable', (
+            'Второй процесс не должен обрабатывать обновления'
+        )
+        app.shutdown()
+        assert len(received) == 1
+
+    def test_full_lane_answers_503(self):
+        started, release = threading.Event(), threading.Event()
+
+        def handler(message):
+            started.set()
+            release.wait(1)
+
+        app = self.make_app(handler, lanes=LaneExecutor(1, 1))
+        assert request(app, recorded_update(1)) == '200 OK'
+        started.wait(1)
+        assert request(app, recorded_update(2)) == '200 OK'
+        assert request(app, recorded_update(3)) == '503 Service Unavailable', (
+            'При заполненной полосе Telegram должен получить 503 и повторить'
+        )
+        release.set()
+        app.shutdown()
+        assert request(app, recorded_update(4)) == '503 Service Unavailable'
+
+    def test_webhook_path(self):
+        assert webhook_path('https://example.com/bot/hook') == '/bot/hook'
+        assert webhook_path('https://example.com') == '/'
+        assert webhook_path(None) == '/'
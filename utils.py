@@ -1,68 +1,363 @@
+import heapq
+import threading
 import time
-from datetime import datetime, timedelta
-import pytz  # type: ignore
-from database import DB
+from datetime import datetime
+from database import (
+    DB, invalidate_reminders, run_backfills, subscribe_reminders
+)
+from dispatcher import MessageDispatcher
+from outbox import OutboxSender, enqueue_many
+from leases import LEASE_RENEW, ShardLeases, shard_filter
+from metrics import OUTBOX_PENDING, QUEUE_DEPTH, SEND_RATE, TICK_DURATION
+from recurrence import next_occurrence
+from retention import retention_loop
+
+# Все сроки — целые секунды UTC epoch (колонка reminders.due_at)
+# Горизонт предзагрузки напоминаний в очередь, сек
+LOAD_HORIZON = 3600
+# Размер пачки при выборке напоминаний из базы
+BATCH_SIZE = 500
+# Как часто проверять напоминания, созданные другими процессами, сек
+NEW_ROWS_POLL = 1
+
+# Выборка активных напоминаний со сроком до заданного момента,
+# постранично по ключу (due_at, id) — идёт по индексу idx_reminders_due_shard.
+# {shards} — необязательный отбор по шардам (см. leases.shard_filter)
+DUE_IDS_QUERY = '''
+    SELECT id, due_at
+    FROM reminders
+    WHERE is_active = 1 AND due_at <= ? AND (due_at, id) > (?, ?){shards}
+    ORDER BY due_at, id
+    LIMIT ?
+'''
+
+
+def now_epoch():
+    """Текущее время в секундах UTC epoch"""
+    return int(time.time())
 
 
 def schedule_checker(bot_instance):
     """Основной цикл проверки напоминаний"""
-    while True:
-        check_reminders(bot_instance)
-        time.sleep(3)
+    scheduler = ReminderScheduler(bot_instance)
+    threading.Thread(target=scheduler.sender.run, daemon=True).start()
+    threading.Thread(target=backfill, args=(scheduler,), daemon=True).start()
+    threading.Thread(target=retention_loop, daemon=True).start()
+    scheduler.run()
 
 
-def check_reminders(bot_instance):
-    """Проверка с учетом часового пояса UTC"""
+def backfill(scheduler):
+    """Переносы данных в фоне; после них очередь перечитывается из базы"""
     try:
+        if run_backfills():
+            scheduler.reload_soon()
+    except Exception as e:
+        print(f"Ошибка переноса данных: {e}")
+
+
+class ReminderScheduler:
+    """Планировщик напоминаний на min-heap по времени срабатывания.
+
+    Поток спит до ближайшего напоминания и просыпается раньше, если
+    add_reminder/delete_reminder изменили очередь. Устаревшие записи
+    кучи удаляются лениво: запись актуальна, только если её время
+    совпадает с self._due[rem_id].
+
+    Процесс обслуживает только арендованные шарды (см. leases.py), так
+    что несколько процессов делят напоминания между собой. Напоминания,
+    созданные в других процессах, подхватываются опросом новых id раз
+    в NEW_ROWS_POLL секунд.
+    """
+
+    def __init__(self, bot_instance, horizon=LOAD_HORIZON, dispatcher=None,
+                 leases=None):
+        self.bot = bot_instance
+        self.dispatcher = dispatcher or MessageDispatcher(bot_instance)
+        self.sender = OutboxSender(self.dispatcher)
+        self.leases = leases or ShardLeases()
+        self.horizon = horizon
+        self._heap = []
+        self._due = {}
+        self._loaded_until = None
+        self._maintain_at = 0
+        self._leases_renew_at = 0
+        self._last_seen_id = 0
+        self._cond = threading.Condition()
+        self.stopped = threading.Event()
+        subscribe_reminders(self.on_reminder_changed)
+        QUEUE_DEPTH.set_function(lambda: len(self._due))
+        OUTBOX_PENDING.set_function(self.sender.pending_count)
+        SEND_RATE.set_function(self.dispatcher.throughput)
+
+    def on_reminder_changed(self, rem_id, due_at):
+        """Обработчик изменений из database.py"""
+        if due_at is None:
+            self.cancel(rem_id)
+        else:
+            self.schedule(rem_id, due_at)
+
+    def schedule(self, rem_id, due_at):
+        """Поставить напоминание в очередь (или перенести)"""
+        with self._cond:
+            if self._loaded_until is not None and due_at > self._loaded_until:
+                # Попадёт в очередь при следующей предзагрузке
+                self._due.pop(rem_id, None)
+                return
+            self._due[rem_id] = due_at
+            heapq.heappush(self._heap, (due_at, rem_id))
+            if self._heap[0][1] == rem_id:
+                self.wake()
+
+    def wake(self):
+        """Разбудить цикл планировщика, вызывается под self._cond"""
+        self._cond.notify()
+
+    def reload_soon(self):
+        """Перечитать очередь из базы на следующем шаге цикла"""
+        with self._cond:
+            self._loaded_until = 0
+            self.wake()
+
+    def cancel(self, rem_id):
+        """Убрать напоминание из очереди"""
+        with self._cond:
+            self._due.pop(rem_id, None)
+
+    def _merge(self, rows):
+        for rem_id, due_at in rows:
+            if self._due.get(rem_id) != due_at:
+                self._due[rem_id] = due_at
+                heapq.heappush(self._heap, (due_at, rem_id))
+
+    def reload(self):
+        """Предзагрузка активных напоминаний своих шардов до горизонта"""
         with DB() as cursor:
-            now_utc = datetime.now(pytz.utc).replace(tzinfo=None)  # Убираем tzinfo для сравнения
-
-            # Выбираем только активные напоминания
-            cursor.execute('''
-                SELECT id, user_id, text, datetime, repeat
-                FROM reminders
-                WHERE is_active = 1
-            ''')
-
-            for rem in cursor.fetchall():
-                rem_id, user_id, text, dt_str, repeat = rem
-                try:
-                    dt = datetime.strptime(dt_str, '%Y-%m-%d %H:%M:%S')
-
-                    # Проверяем с запасом в 5 секунд для компенсации задержек
-                    if dt <= now_utc + timedelta(seconds=5):
-                        try:
-                            # Отправляем напоминание
-                            bot_instance.send_message(
-                                user_id,
-                                f"⏰ Напоминание: {text}\nВремя: {dt.strftime('%H:%M %d.%m.%Y')}"
-                            )
-
-                            # Обновляем дату для повторяющихся
-                            if repeat:
-                                delta = {
-                                    'daily': timedelta(days=1),
-                                    'weekly': timedelta(weeks=1),
-                                    'monthly': timedelta(days=30),
-                                    'yearly': timedelta(days=365)
-                                }.get(repeat)
-
-                                new_dt = dt + delta
-                                cursor.execute(
-                                    'UPDATE reminders SET datetime = ? WHERE id = ?',
-                                    (new_dt.strftime('%Y-%m-%d %H:%M:%S'), rem_id)
-                                )
-                            else:
-                                cursor.execute(
-                                    'UPDATE reminders SET is_active = 0 WHERE id = ?',
-                                    (rem_id,)
-                                )
-
-                        except Exception as e:
-                            print(f"Ошибка отправки: {e}")
-
-                except Exception as e:
-                    print(f"Ошибка обработки даты {rem_id}: {e}")
+            cursor.execute('SELECT MAX(id) FROM reminders')
+            last_seen_id = cursor.fetchone()[0] or 0
+        until = now_epoch() + self.horizon
+        rows = []
+        if self.leases.owned:
+            for batch in iter_due_batches(
+                until, shards=self.leases.owned,
+                shard_count=self.leases.shard_count
+            ):
+                rows.extend(batch)
 
-    except Exception as e:
-        print(f"Ошибка в check_reminders: {e}")
+        with self._cond:
+            self._merge(rows)
+            self._last_seen_id = max(self._last_seen_id, last_seen_id)
+            self._loaded_until = until
+            self.wake()
+
+    def poll_new(self):
+        """Подхват напоминаний, созданных другими процессами"""
+        if not self.leases.owned:
+            return
+        condition, params = shard_filter(
+            self.leases.owned, self.leases.shard_count
+        )
+        with DB() as cursor:
+            cursor.execute(
+                'SELECT MAX(id) FROM reminders WHERE id > ?',
+                (self._last_seen_id,)
+            )
+            last_seen_id = cursor.fetchone()[0]
+            if last_seen_id is None:
+                return
+            cursor.execute(
+                'SELECT id, due_at FROM reminders '
+                'WHERE id > ? AND id <= ? AND is_active = 1 AND due_at <= ? '
+                f'AND {condition}',
+                (self._last_seen_id, last_seen_id, self._loaded_until, *params)
+            )
+            rows = cursor.fetchall()
+        with self._cond:
+            self._merge(rows)
+            self._last_seen_id = last_seen_id
+
+    def maintain(self):
+        """Продление аренды шардов и опрос новых напоминаний"""
+        now = time.time()
+        if now >= self._leases_renew_at:
+            if self.leases.refresh():
+                # Получены новые шарды — их напоминания нужно загрузить
+                self._loaded_until = None
+            self._leases_renew_at = now + LEASE_RENEW
+        if self._loaded_until is not None:
+            self.poll_new()
+        self._maintain_at = now + NEW_ROWS_POLL
+
+    def prepare(self):
+        """Обслуживание и предзагрузка, если подошёл их срок"""
+        if time.time() >= self._maintain_at:
+            self.maintain()
+        if self._loaded_until is None or time.time() >= self._loaded_until:
+            self.reload()
+
+    def wake_at(self):
+        """Когда циклу нужно проснуться: ближайший срок или обслуживание"""
+        with self._cond:
+            wake_at = min(self._loaded_until, self._maintain_at)
+            if self._heap and self._heap[0][0] < wake_at:
+                wake_at = self._heap[0][0]
+            return wake_at
+
+    def pop_due(self):
+        """Ждать до ближайшего срока и вернуть id наступивших напоминаний"""
+        with self._cond:
+            now = time.time()
+            wake_at = self.wake_at()
+            if wake_at > now:
+                self._cond.wait(wake_at - now)
+                now = time.time()
+            return self.take_due(now)
+
+    def take_due(self, now):
+        """Извлечь из кучи id напоминаний со сроком не позже now"""
+        with self._cond:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due_at, rem_id = heapq.heappop(self._heap)
+                if self._due.get(rem_id) == due_at:
+                    del self._due[rem_id]
+                    due.append(rem_id)
+            return due
+
+    def fire(self, rem_ids):
+        """Постановка наступивших напоминаний в очередь отправки"""
+        started = time.perf_counter()
+        try:
+            for rem_id, new_due_at in enqueue_reminders(
+                fetch_reminders(
+                    rem_ids, self.leases.owned, self.leases.shard_count
+                ),
+                now_epoch()
+            ):
+                if new_due_at is not None:
+                    self.schedule(rem_id, new_due_at)
+            self.sender.notify()
+        except Exception as e:
+            print(f"Ошибка в ReminderScheduler.fire: {e}")
+        TICK_DURATION.observe(time.perf_counter() - started)
+
+    def stop(self):
+        """Остановить цикл run и отправителя"""
+        self.stopped.set()
+        self.sender.stop()
+        with self._cond:
+            self.wake()
+        for gauge in (QUEUE_DEPTH, OUTBOX_PENDING, SEND_RATE):
+            gauge.set_function(None)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.prepare()
+            except Exception as e:
+                print(f"Ошибка в ReminderScheduler: {e}")
+                self.stopped.wait(NEW_ROWS_POLL)
+                continue
+            due = self.pop_due()
+            if due:
+                self.fire(due)
+
+
+def fetch_reminders(rem_ids, shards=None, shard_count=None):
+    """Активные напоминания по списку id (только из шардов shards, если заданы)"""
+    placeholders = ', '.join('?' * len(rem_ids))
+    condition, params = '', []
+    if shards is not None:
+        if not shards:
+            return []
+        condition, params = shard_filter(shards, shard_count)
+        condition = ' AND ' + condition
+    with DB() as cursor:
+        cursor.execute(f'''
+            SELECT id, user_id, text, due_at, repeat,
+                   COALESCE(anchor_at, due_at)
+            FROM reminders
+            WHERE is_active = 1 AND id IN ({placeholders}){condition}
+        ''', [*rem_ids, *params])
+        return cursor.fetchall()
+
+
+def format_reminder(text, due_at):
+    return (
+        f"⏰ Напоминание: {text}\n"
+        f"Время: {datetime.fromtimestamp(due_at).strftime('%H:%M %d.%m.%Y')}"
+    )
+
+
+def enqueue_reminders(rems, now):
+    """Постановка наступивших напоминаний в outbox.
+
+    Изменения тика собираются в списки и применяются через executemany
+    одной короткой транзакцией без сетевых вызовов: запись в outbox,
+    перенос повторяющихся и деактивация разовых напоминаний. Отправкой
+    занимается OutboxSender. Возвращает пары (id, срок), где срок —
+    следующее срабатывание или None, если оно больше не запланировано.
+    """
+    result, messages, moved, finished = [], [], [], []
+    for rem_id, user_id, text, due_at, repeat, anchor_at in rems:
+        if due_at > now:
+            result.append((rem_id, due_at))
+            continue
+
+        messages.append((
+            f'reminder:{rem_id}:{due_at}',
+            rem_id,
+            due_at,
+            user_id,
+            format_reminder(text, due_at)
+        ))
+
+        # Повторяющиеся переносим сразу на ближайший срок после now:
+        # после простоя пропущенные периоды не отправляются по одному
+        new_due_at = None
+        if repeat:
+            new_due_at = next_occurrence(repeat, anchor_at, due_at, now)
+        if new_due_at is not None:
+            moved.append((new_due_at, rem_id))
+            result.append((rem_id, new_due_at))
+        else:
+            finished.append((rem_id,))
+            result.append((rem_id, None))
+
+    if messages:
+        with DB() as cursor:
+            apply_tick(cursor, messages, moved, finished)
+        invalidate_reminders(*{message[3] for message in messages})
+    return result
+
+
+def apply_tick(cursor, messages, moved, finished):
+    """Запись изменений тика: по одному executemany на вид изменения"""
+    enqueue_many(cursor, messages)
+    cursor.executemany(
+        'UPDATE reminders SET due_at = ? WHERE id = ?', moved
+    )
+    cursor.executemany(
+        'UPDATE reminders SET is_active = 0 WHERE id = ?', finished
+    )
+
+
+def iter_due_batches(until, batch_size=BATCH_SIZE, shards=None,
+                     shard_count=None):
+    """Пачки (id, due_at) активных напоминаний со сроком не позже until"""
+    query, params = DUE_IDS_QUERY.format(shards=''), []
+    if shards is not None:
+        condition, params = shard_filter(shards, shard_count)
+        query = DUE_IDS_QUERY.format(shards=' AND ' + condition)
+    last_due_at, last_id = -1, 0
+    while True:
+        with DB() as cursor:
+            cursor.execute(
+                query, (until, last_due_at, last_id, *params, batch_size)
+            )
+            batch = cursor.fetchall()
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        last_id, last_due_at = batch[-1]
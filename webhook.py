@@ -0,0 +1,160 @@
+"""Приём обновлений Telegram через webhook вместо long polling.
+
+WebhookApp — WSGI-приложение: проверяет секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token, разбирает тело (одно обновление
+или список — так удобно подавать записанные обновления локально)
+и раздаёт их по полосам LaneExecutor (см. lanes.py). Когда очередь
+полосы заполнена, отвечает 503: Telegram повторит доставку позже,
+а память процесса не растёт.
+
+Обновления обслуживает один процесс: очерёдность шагов диалога
+держат полосы LaneExecutor, а кэш списков (database.UserCache) не
+сбрасывается из других процессов. Поэтому WSGI-сервер запускается с
+одним рабочим процессом: gunicorn -w 1 bot:application. ProcessLock
+это проверяет: процесс, не получивший блокировку файла, отвечает 503.
+Планировщик тогда запускается отдельно (worker.py). Без
+WEBHOOK_SECRET приложение отвечает 403 на все запросы.
+"""
+import fcntl
+import hmac
+import json
+import os
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from telebot import types  # type: ignore
+
+from lanes import LaneExecutor
+from metrics import WEBHOOK_UPDATES
+
+SECRET_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+# Telegram присылает одно обновление в запросе, запас — для пачек
+MAX_BODY_SIZE = 1024 * 1024
+DEFAULT_PORT = 8443
+
+
+class ProcessLock:
+    """Исключительная блокировка файла за одним процессом.
+
+    Берётся при первом запросе в процессе, а не при создании
+    приложения: с gunicorn --preload приложение создаётся до fork.
+    Снимается системой, когда процесс завершается.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = None
+        self.file = None
+
+    def acquire(self):
+        """True, если блокировка у текущего процесса"""
+        if self.pid == os.getpid():
+            return True
+        file = open(self.path, 'a')
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            file.close()
+            return False
+        self.file, self.pid = file, os.getpid()
+        return True
+
+
+class WebhookApp:
+
+    def __init__(self, bot, secret=None, path='/', lanes=None, lock=None):
+        self.bot = bot
+        self.secret = secret
+        self.path = path or '/'
+        self.lanes = lanes or LaneExecutor()
+        self.lock = lock
+
+    def __call__(self, environ, start_response):
+        status, body = self.handle(environ)
+        start_response(status, [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+    def handle(self, environ):
+        """(статус, тело ответа) для запроса"""
+        if environ.get('PATH_INFO', '/') != self.path:
+            return '404 Not Found', b''
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return '405 Method Not Allowed', b''
+        # Без секрета нельзя отличить Telegram от любого отправителя
+        if not self.secret or not hmac.compare_digest(
+            environ.get(SECRET_HEADER, '').encode(), self.secret.encode()
+        ):
+            WEBHOOK_UPDATES.inc(result='forbidden')
+            return '403 Forbidden', b''
+        if self.lock is not None and not self.lock.acquire():
+            WEBHOOK_UPDATES.inc(result='other_process')
+            print("Webhook уже обслуживает другой процесс, нужен один рабочий")
+            return '503 Service Unavailable', b''
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return '400 Bad Request', b''
+        if length > MAX_BODY_SIZE:
+            return '413 Payload Too Large', b''
+        try:
+            updates = parse_updates(environ['wsgi.input'].read(length))
+        except ValueError as e:
+            WEBHOOK_UPDATES.inc(result='invalid')
+            print(f"Некорректный запрос webhook: {e}")
+            return '400 Bad Request', b''
+        rejected = self.lanes.process_updates(self.bot, updates, block=False)
+        WEBHOOK_UPDATES.inc(len(updates) - rejected, result='accepted')
+        if rejected:
+            # Telegram присылает по одному обновлению, повторит его целиком
+            WEBHOOK_UPDATES.inc(rejected, result='rejected')
+            return '503 Service Unavailable', b''
+        return '200 OK', b''
+
+    def shutdown(self, wait=True):
+        self.lanes.shutdown(wait=wait)
+
+
+def parse_updates(body):
+    """Список types.Update из JSON-объекта или массива; ValueError при ошибке"""
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'не JSON: {e}')
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(
+        isinstance(item, dict) and 'update_id' in item for item in data
+    ):
+        raise ValueError('ожидается обновление или список обновлений')
+    return [types.Update.de_json(item) for item in data]
+
+
+def webhook_path(url):
+    return (urlparse(url).path or '/') if url else '/'
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(app, host='0.0.0.0', port=DEFAULT_PORT):
+    """Встроенный HTTP-сервер; TLS ожидается на прокси перед ним"""
+    server = make_server(
+        host, port, app,
+        server_class=ThreadingWSGIServer, handler_class=QuietHandler,
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        app.shutdown()
@@ -0,0 +1,21 @@
+"""Отдельный процесс планировщика напоминаний без приёма сообщений.
+
+Таких процессов можно запустить несколько: они делят напоминания по
+шардам (см. leases.py). Число шардов SCHEDULER_SHARDS должно быть
+одинаковым у всех процессов.
+"""
+import os
+import telebot  # type: ignore
+from dotenv import load_dotenv  # type: ignore
+
+import metrics
+from storage import SQLiteStorage
+from utils import schedule_checker
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    SQLiteStorage()
+    if os.getenv("METRICS_PORT"):
+        metrics.start_http_server(int(os.getenv("METRICS_PORT")))
+    schedule_checker(telebot.TeleBot(os.getenv("TELEGRAM_TOKEN")))